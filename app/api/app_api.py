@@ -1,18 +1,27 @@
 import os
+import asyncio
+import orjson
 from datetime import date, timedelta
+from functools import lru_cache
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field, EmailStr, field_validator
 
-from app.services.amadeus_client import AmadeusClient, AmadeusHTTPError
+from app.services.amadeus_client import AmadeusHTTPError, get_async_client, close_async_client
+from app.services.cache import cache_get_json, cache_set_json
 from app.store.db import (
     init_db,
+    close_db,
     list_watches,
+    count_watches,
+    list_watches_in_window,
     delete_watch_by_id,
     ensure_watch,
-    history_min_median,
-    history_for_watch,
+    history_stats_for_watches,
+    iter_history_for_watch,
     get_global_min_for_window,
     ensure_subscription,
     get_subscriptions_for_watch,
@@ -23,6 +32,7 @@ from app.store.db import (
 from fastapi.middleware.cors import CORSMiddleware
 
 VALID_CABINS = {"ECONOMY", "PREMIUM_ECONOMY", "BUSINESS", "FIRST"}
+_VALID_CABINS_MSG = f"cabin must be one of {sorted(VALID_CABINS)}"
 
 # window config (matches your scheduler defaults)
 ORIGIN = os.getenv("ORIGIN", "BWI").upper()
@@ -30,12 +40,26 @@ DEST = os.getenv("DEST", "SFO").upper()
 START_OFFSET_DAYS = int(os.getenv("START_OFFSET_DAYS", "30"))
 WINDOW_DAYS = int(os.getenv("WINDOW_DAYS", "30"))
 START_DATE = os.getenv("START_DATE")  # optional YYYY-MM-DD
+START = date.fromisoformat(START_DATE) if START_DATE else None
+
+# cache TTLs (seconds): live fares go stale fast, window stats only change per snapshot run
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "120"))
+WINDOW_CACHE_TTL = int(os.getenv("WINDOW_CACHE_TTL", "30"))
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson (C encoder, emits bytes directly)."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
 
 app = FastAPI(
     title="Farewatch API",
     description="Local API for your flight price watcher.",
     version="0.1.0",
     on_startup=[init_db],
+    on_shutdown=[close_async_client, close_db],
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -50,7 +74,26 @@ app.add_middleware(
 # -------------------------
 # Models
 # -------------------------
-class SearchRequest(BaseModel):
+class _TripParams(BaseModel):
+    """
+    Shared normalization for SearchRequest / WatchCreate. Runs in "before" mode
+    so codes are uppercased once, ahead of the Field length/pattern checks.
+    """
+
+    @field_validator("origin", "destination", "currency", mode="before", check_fields=False)
+    @classmethod
+    def upper_codes(cls, v):
+        return v.upper() if isinstance(v, str) else v
+
+    @field_validator("cabin", mode="before", check_fields=False)
+    @classmethod
+    def normalize_cabin(cls, v):
+        if not isinstance(v, str) or v.upper() not in VALID_CABINS:
+            raise ValueError(_VALID_CABINS_MSG)
+        return v.upper()
+
+
+class SearchRequest(_TripParams):
     origin: str = Field(..., min_length=3, max_length=3, description="IATA code of origin airport", examples=["BWI"])
     destination: str = Field(..., min_length=3, max_length=3, description="IATA code of destination airport", examples=["SFO"])
     depart_date: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$", description="Departure date YYYY-MM-DD", examples=["2025-12-25"])
@@ -60,29 +103,8 @@ class SearchRequest(BaseModel):
     max_price: Optional[float] = Field(None, gt=0)
     max_results: int = Field(10, ge=1, le=50)
 
-    @field_validator("origin", "destination", "currency")
-    @classmethod
-    def upper_codes(cls, v: str) -> str:
-        return v.upper()
-
-    @field_validator("cabin")
-    @classmethod
-    def normalize_cabin(cls, v: str) -> str:
-        v_up = v.upper()
-        if v_up not in VALID_CABINS:
-            raise ValueError(f"cabin must be one of {sorted(VALID_CABINS)}")
-        return v_up
-
 
-class SearchOffer(BaseModel):
-    total: float
-    currency: str
-    carrier: Optional[str] = None
-    segments: Optional[int] = None
-    duration: Optional[str] = None
-
-
-class WatchCreate(BaseModel):
+class WatchCreate(_TripParams):
     origin: str = Field(..., min_length=3, max_length=3, pattern=r"^[A-Za-z]{3}$")
     destination: str = Field(..., min_length=3, max_length=3, pattern=r"^[A-Za-z]{3}$")
     depart_date: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$")
@@ -91,19 +113,6 @@ class WatchCreate(BaseModel):
     currency: str = Field("USD", min_length=3, max_length=3, pattern=r"^[A-Za-z]{3}$")
     alert_email: Optional[EmailStr] = None  # optional subscription on create
 
-    @field_validator("origin", "destination", "currency")
-    @classmethod
-    def upper_codes(cls, v: str) -> str:
-        return v.upper()
-
-    @field_validator("cabin")
-    @classmethod
-    def normalize_cabin(cls, v: str) -> str:
-        v_up = v.upper()
-        if v_up not in VALID_CABINS:
-            raise ValueError(f"cabin must be one of {sorted(VALID_CABINS)}")
-        return v_up
-
 
 class SubscribeRequest(BaseModel):
     watch_id: int
@@ -113,9 +122,9 @@ class SubscribeRequest(BaseModel):
 # -------------------------
 # Basic routes
 # -------------------------
-@app.get("/")
-def index():
-    return {
+# constant payloads, serialized once at import (healthz is the LB probe hot path)
+_INDEX = Response(
+    content=orjson.dumps({
         "message": "farewatch api up",
         "routes": {
             "docs": "/docs",
@@ -126,24 +135,41 @@ def index():
             "cheapest": "/cheapest",
             "window": "/window",
         },
-    }
+    }),
+    media_type="application/json",
+)
+_HEALTHZ = Response(content=b'{"ok":true}', media_type="application/json")
+
+
+@app.get("/")
+def index():
+    return _INDEX
 
 
-@app.get("/healthz")
+# HEAD gets the same headers; the server drops the body
+@app.api_route("/healthz", methods=["GET", "HEAD"])
 def healthz():
-    return {"ok": True}
+    return _HEALTHZ
 
 
 # -------------------------
 # Watches
 # -------------------------
 @app.get("/watches")
-def get_watches(alert_email: Optional[str] = Query(default=None, description="Filter by subscriber email (optional)")):
-    watches = list_watches()
+def get_watches(
+    alert_email: Optional[str] = Query(default=None, description="Filter by subscriber email (optional)"),
+    page: Optional[int] = Query(default=None, ge=1, description="1-based page; omit for all watches"),
+    size: int = Query(default=25, ge=1, le=200, description="Watches per page (with page)"),
+):
+    if page is None:
+        watches = list_watches()
+    else:
+        watches = list_watches(limit=size, offset=(page - 1) * size)
+    all_stats = history_stats_for_watches([w["id"] for w in watches])
 
     # attach stats (helps streamlit UI)
     for w in watches:
-        stats = history_min_median(w["id"])
+        stats = all_stats.get(w["id"])
         if stats:
             w["n"] = stats["n"]
             w["latest_cents"] = stats["latest_cents"]
@@ -159,7 +185,9 @@ def get_watches(alert_email: Optional[str] = Query(default=None, description="Fi
     # your new design is subscriptions-based. So we don't filter watches by email here.
     # Streamlit should instead call /watches/{id}/subscriptions and filter client-side if needed.
 
-    return {"count": len(watches), "watches": watches}
+    if page is None:
+        return {"count": len(watches), "watches": watches}
+    return {"count": len(watches), "watches": watches, "total": count_watches(), "page": page, "size": size}
 
 
 @app.post("/watches")
@@ -238,37 +266,38 @@ def unsubscribe(req: SubscribeRequest):
 # -------------------------
 # History + window helpers
 # -------------------------
+def _json_array_chunks(first: list[dict], rest):
+    """Encode row batches as one JSON array, a batch per chunk."""
+    yield b"[" + orjson.dumps(first)[1:-1]
+    for batch in rest:
+        yield b"," + orjson.dumps(batch)[1:-1]
+    yield b"]"
+
+
 @app.get("/history/{watch_id}")
 def get_history(watch_id: int):
-    rows = history_for_watch(watch_id)
-    if not rows:
+    batches = iter_history_for_watch(watch_id)
+    first = next(batches, None)
+    if first is None:
         raise HTTPException(status_code=404, detail="No history for that watch_id")
-    for r in rows:
-        r["price_usd"] = r["price_cents"] / 100.0
-    return rows
+    # stream the array batch by batch instead of materializing every row
+    return StreamingResponse(_json_array_chunks(first, batches), media_type="application/json")
 
 
-@app.get("/window")
-def get_window_info():
-    if START_DATE:
-        start = date.fromisoformat(START_DATE)
-    else:
-        start = date.today() + timedelta(days=START_OFFSET_DAYS)
+@lru_cache(maxsize=1)
+def _window_for_today(today_ordinal: int) -> tuple[date, date]:
+    """Rolling (start, end) window; keyed by today's ordinal so it rolls over at midnight."""
+    start = date.fromordinal(today_ordinal) + timedelta(days=START_OFFSET_DAYS)
+    return start, start + timedelta(days=WINDOW_DAYS - 1)
 
-    end = start + timedelta(days=WINDOW_DAYS - 1)
 
-    watches = list_watches()
+def _build_window_info(start: date, end: date) -> dict:
+    watches = list_watches_in_window(ORIGIN, DEST, start.isoformat(), end.isoformat())
+    all_stats = history_stats_for_watches([w["id"] for w in watches])
     rows = []
 
     for w in watches:
-        if w["origin"] != ORIGIN or w["destination"] != DEST:
-            continue
-
-        dep = date.fromisoformat(w["depart_date"])
-        if not (start <= dep <= end):
-            continue
-
-        stats = history_min_median(w["id"])
+        stats = all_stats.get(w["id"])
         if not stats:
             continue
 
@@ -285,8 +314,7 @@ def get_window_info():
             }
         )
 
-    rows.sort(key=lambda r: r["depart_date"])
-
+    # already ordered by depart_date in SQL
     return {
         "origin": ORIGIN,
         "destination": DEST,
@@ -296,59 +324,60 @@ def get_window_info():
     }
 
 
+@app.get("/window")
+async def get_window_info():
+    if START:
+        start, end = START, START + timedelta(days=WINDOW_DAYS - 1)
+    else:
+        start, end = _window_for_today(date.today().toordinal())
+
+    key = f"window:{ORIGIN}:{DEST}:{start.isoformat()}:{end.isoformat()}"
+    cached = await cache_get_json(key)
+    if cached is not None:
+        return cached
+
+    payload = await run_in_threadpool(_build_window_info, start, end)
+    await cache_set_json(key, payload, WINDOW_CACHE_TTL)
+    return payload
+
+
 @app.get("/cheapest")
-def get_cheapest_in_window():
-    start = date.today() + timedelta(days=START_OFFSET_DAYS)
-    end = start + timedelta(days=WINDOW_DAYS - 1)
+async def get_cheapest_in_window():
+    start, end = _window_for_today(date.today().toordinal())
+
+    key = f"cheapest:{ORIGIN}:{DEST}:{start.isoformat()}:{end.isoformat()}"
+    cached = await cache_get_json(key)
+    if cached is not None:
+        return cached
 
-    gm = get_global_min_for_window(ORIGIN, DEST, start.isoformat(), end.isoformat())
+    gm = await run_in_threadpool(get_global_min_for_window, ORIGIN, DEST, start.isoformat(), end.isoformat())
     if not gm:
-        return {"message": "No data yet for this window."}
+        payload = {"message": "No data yet for this window."}
+    else:
+        payload = {
+            "origin": ORIGIN,
+            "destination": DEST,
+            "window_start": start.isoformat(),
+            "window_end": end.isoformat(),
+            "depart_date": gm["depart_date"],
+            "price_usd": gm["min_cents"] / 100.0,
+            "watch_id": gm["watch_id"],
+        }
 
-    return {
-        "origin": ORIGIN,
-        "destination": DEST,
-        "window_start": start.isoformat(),
-        "window_end": end.isoformat(),
-        "depart_date": gm["depart_date"],
-        "price_usd": gm["min_cents"] / 100.0,
-        "watch_id": gm["watch_id"],
-    }
+    await cache_set_json(key, payload, WINDOW_CACHE_TTL)
+    return payload
 
 
 # -------------------------
 # Live search
 # -------------------------
-@app.post("/search", response_model=dict)
-def search_flights(req: SearchRequest):
-    client = AmadeusClient()
-
-    try:
-        offers = client.search_offers(
-            origin=req.origin,
-            dest=req.destination,
-            depart_date=req.depart_date,
-            adults=req.adults,
-            cabin=req.cabin,
-            currency=req.currency,
-            limit=20,
-        )
-    except AmadeusHTTPError as e:
-        raise HTTPException(status_code=e.status, detail=e.payload)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    if not offers:
-        return {
-            "origin": req.origin,
-            "destination": req.destination,
-            "depart_date": req.depart_date,
-            "count": 0,
-            "offers": [],
-            "message": "No offers found for that search.",
-        }
-
-    simplified: list[SearchOffer] = []
+def _simplify_offers(offers: list[dict], default_currency: str) -> list[dict]:
+    """
+    Reduce raw Amadeus offers to {total, currency, carrier, segments, duration}
+    dicts, cheapest first. Plain dicts: the data is already parsed JSON and is
+    serialized straight back out, so a Pydantic model per offer buys nothing.
+    """
+    simplified: list[dict] = []
 
     for o in offers:
         price = o.get("price") or {}
@@ -374,26 +403,94 @@ def search_flights(req: SearchRequest):
                 carrier = segs[0].get("carrierCode")
 
         simplified.append(
-            SearchOffer(
-                total=total,
-                currency=price.get("currency", req.currency),
-                carrier=carrier,
-                segments=segments,
-                duration=duration,
-            )
+            {
+                "total": total,
+                "currency": price.get("currency", default_currency),
+                "carrier": carrier,
+                "segments": segments,
+                "duration": duration,
+            }
         )
 
-    simplified.sort(key=lambda s: s.total)
+    simplified.sort(key=lambda s: s["total"])
+    return simplified
+
+
+# Amadeus searches currently in flight, keyed like the cache: a burst of
+# identical /search requests waits on one upstream call instead of N
+_inflight: dict[str, asyncio.Future] = {}
+
+
+async def _fetch_offers(key: str, req: SearchRequest) -> Optional[list[dict]]:
+    """
+    Search Amadeus (coalescing concurrent identical searches) and cache the
+    simplified offers. Returns None when Amadeus has no offers.
+    """
+    fut = _inflight.get(key)
+    if fut is not None:
+        # shield: one waiter going away must not cancel the shared lookup
+        return await asyncio.shield(fut)
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        offers = await get_async_client().search_offers(
+            origin=req.origin,
+            dest=req.destination,
+            depart_date=req.depart_date,
+            adults=req.adults,
+            cabin=req.cabin,
+            currency=req.currency,
+            limit=20,
+        )
+        simplified = _simplify_offers(offers, req.currency) if offers else None
+        if simplified is not None:
+            await cache_set_json(key, simplified, SEARCH_CACHE_TTL)
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # waiters re-raise it; don't log it as "never retrieved"
+        raise
+    else:
+        fut.set_result(simplified)
+        return simplified
+    finally:
+        _inflight.pop(key, None)
+        if not fut.done():  # we were cancelled mid-call
+            fut.cancel()
+
+
+@app.post("/search", response_model=dict)
+async def search_flights(req: SearchRequest):
+    key = f"search:{req.origin}:{req.destination}:{req.depart_date}:{req.cabin}:{req.adults}:{req.currency}"
+    simplified = await cache_get_json(key)
+
+    if simplified is None:
+        try:
+            simplified = await _fetch_offers(key, req)
+        except AmadeusHTTPError as e:
+            raise HTTPException(status_code=e.status, detail=e.payload)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        if simplified is None:
+            return {
+                "origin": req.origin,
+                "destination": req.destination,
+                "depart_date": req.depart_date,
+                "count": 0,
+                "offers": [],
+                "message": "No offers found for that search.",
+            }
 
     if req.max_price is not None:
-        simplified = [s for s in simplified if s.total <= req.max_price]
+        simplified = [s for s in simplified if s["total"] <= req.max_price]
 
     simplified = simplified[: req.max_results]
 
-    return {
+    return ORJSONResponse({
         "origin": req.origin,
         "destination": req.destination,
         "depart_date": req.depart_date,
         "count": len(simplified),
-        "offers": [s.model_dump() for s in simplified],
-    }
\ No newline at end of file
+        "offers": simplified,
+    })
@@ -1,23 +1,22 @@
-import os
 import logging
 from typing import Optional, Dict, Any
 
-from amadeus import Client, ResponseError
-
+from app.services.amadeus_client import AmadeusHTTPError, get_async_client
 from app.store.db import history_min_median
 
 log = logging.getLogger(__name__)
 
-# Amadeus client using your env vars
-AMADEUS = Client(
-    client_id=os.getenv("AMADEUS_CLIENT_ID"),
-    client_secret=os.getenv("AMADEUS_CLIENT_SECRET"),
-)
-
 
 def is_new_low(watch_id: int) -> Optional[Dict]:
     """Return dict if latest price is the lowest ever for this watch."""
-    stats = history_min_median(watch_id)
+    return is_new_low_from_stats(history_min_median(watch_id))
+
+
+def is_new_low_from_stats(stats: Optional[Dict]) -> Optional[Dict]:
+    """
+    is_new_low for stats already in hand (a history_min_median /
+    history_stats_for_watches entry), without another query.
+    """
     if not stats or stats["n"] < 2:  # need at least 2 points to call a “new low”
         return None
 
@@ -40,10 +39,11 @@ def drop_pct(old_cents: int, new_cents: int) -> float:
     return 100.0 * (old_cents - new_cents) / old_cents
 
 
-def search_best_offer_for_watch(watch: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+async def search_best_offer_for_watch(watch: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     Call Amadeus for a one-way flight that matches this watch and
-    return the single best (cheapest) offer.
+    return the single best (cheapest) offer. Async so the scheduler
+    can look up many watches concurrently on the shared client.
 
     Expects `watch` to have:
         origin, destination, depart_date, cabin, adults, currency
@@ -58,23 +58,22 @@ def search_best_offer_for_watch(watch: Dict[str, Any]) -> Optional[Dict[str, Any
     or None if nothing found / error.
     """
     try:
-        response = AMADEUS.shopping.flight_offers_search.get(
-            originLocationCode=watch["origin"],
-            destinationLocationCode=watch["destination"],
-            departureDate=watch["depart_date"],
+        offers = await get_async_client().search_offers(
+            origin=watch["origin"],
+            dest=watch["destination"],
+            depart_date=watch["depart_date"],
             adults=int(watch.get("adults", 1)),
-            travelClass=watch.get("cabin", "ECONOMY"),
-            currencyCode=watch.get("currency", "USD"),
-            max=20,  # you can tweak this
+            cabin=watch.get("cabin", "ECONOMY"),
+            currency=watch.get("currency", "USD"),
+            limit=20,  # you can tweak this
         )
-    except ResponseError as e:
+    except AmadeusHTTPError as e:
         log.warning("Amadeus error for watch %s: %s", watch.get("id"), e)
         return None
     except Exception as e:
         log.exception("Unexpected error calling Amadeus for watch %s: %s", watch.get("id"), e)
         return None
 
-    offers = response.data or []
     if not offers:
         log.info("No Amadeus offers returned for watch %s", watch.get("id"))
         return None
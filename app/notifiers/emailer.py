@@ -1,15 +1,29 @@
 import os
 from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+from sendgrid.helpers.mail import Mail, Personalization, To
 
-def send_email(subject: str, body: str, email_to: str | None):
+# SendGrid caps personalizations per request
+MAX_RECIPIENTS_PER_SEND = 1000
+
+# one client per process (created on first send, after any fork)
+_sg = None
+_sg_key = None
+
+def _get_client(api_key: str) -> SendGridAPIClient:
+    global _sg, _sg_key
+    if _sg is None or _sg_key != api_key:
+        _sg = SendGridAPIClient(api_key)
+        _sg_key = api_key
+    return _sg
+
+def send_emails(subject: str, body: str, recipients: list[str]):
     """
-    Send a plain-text email if ENABLE_EMAIL=true and env vars are set.
+    Send the same plain-text email to many recipients in one SendGrid call
+    (one personalization per recipient, so nobody sees the other addresses).
 
-    Priority:
-      1. Use the email_to argument if provided.
-      2. Otherwise fall back to ALERT_EMAIL_TO from env.
-    If anything important is missing, it just logs and returns silently.
+    Same rules as send_email: needs ENABLE_EMAIL=true and the env vars,
+    falls back to ALERT_EMAIL_TO if recipients is empty, and just logs and
+    returns if anything important is missing.
     """
     if os.getenv("ENABLE_EMAIL", "").lower() != "true":
         # alerts disabled; do nothing
@@ -19,23 +33,39 @@ def send_email(subject: str, body: str, email_to: str | None):
     fallback_to = os.getenv("ALERT_EMAIL_TO")
     from_email = os.getenv("ALERT_EMAIL_FROM")
 
-    # Choose recipient: per-watch email > fallback
-    to_email = email_to or fallback_to
+    # Choose recipients: per-watch emails > fallback
+    to_emails = [e for e in recipients if e] or ([fallback_to] if fallback_to else [])
 
-    if not api_key or not to_email or not from_email:
+    if not api_key or not to_emails or not from_email:
         print("[emailer] Missing SENDGRID_API_KEY / ALERT_EMAIL_FROM / recipient email; not sending.")
         return
 
-    message = Mail(
-        from_email=from_email,
-        to_emails=to_email,
-        subject=subject,
-        plain_text_content=body,
-    )
-
-    try:
-        sg = SendGridAPIClient(api_key)
-        resp = sg.send(message)
-        print(f"[emailer] Sent email '{subject}' to {to_email} (status={resp.status_code})")
-    except Exception as e:
-        print(f"[emailer] Error sending email: {e}")
\ No newline at end of file
+    sg = _get_client(api_key)
+    for i in range(0, len(to_emails), MAX_RECIPIENTS_PER_SEND):
+        chunk = to_emails[i:i + MAX_RECIPIENTS_PER_SEND]
+        message = Mail(
+            from_email=from_email,
+            subject=subject,
+            plain_text_content=body,
+        )
+        for email in chunk:
+            p = Personalization()
+            p.add_to(To(email))
+            message.add_personalization(p)
+
+        try:
+            resp = sg.send(message)
+            print(f"[emailer] Sent email '{subject}' to {len(chunk)} recipient(s) (status={resp.status_code})")
+        except Exception as e:
+            print(f"[emailer] Error sending email: {e}")
+
+def send_email(subject: str, body: str, email_to: str | None):
+    """
+    Send a plain-text email if ENABLE_EMAIL=true and env vars are set.
+
+    Priority:
+      1. Use the email_to argument if provided.
+      2. Otherwise fall back to ALERT_EMAIL_TO from env.
+    If anything important is missing, it just logs and returns silently.
+    """
+    send_emails(subject, body, [email_to] if email_to else [])
@@ -1,7 +1,8 @@
 # app/services/amadeus_client.py
-import os, time, requests
+import asyncio, heapq, os, random, threading, time
+import httpx
 from dotenv import load_dotenv
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 load_dotenv()
 
@@ -9,29 +10,79 @@ BASE = "https://test.api.amadeus.com"
 KEY = os.getenv("AMADEUS_KEY")
 SECRET = os.getenv("AMADEUS_SECRET")
 
+# refresh the OAuth token this long before Amadeus says it expires
+TOKEN_EXPIRY_MARGIN = 60
+
+# retry pacing for 5xx: exponential with full jitter, capped
+MAX_BACKOFF = 8.0
+MAX_RETRY_AFTER = 30.0
+
+def _retry_after(headers) -> Optional[float]:
+    """Numeric Retry-After in seconds (capped), or None if absent/non-numeric."""
+    retry_after = headers.get("retry-after", "")
+    if retry_after.isdigit():
+        return min(float(retry_after), MAX_RETRY_AFTER)
+    return None
+
+def _retry_delay(headers, backoff: float) -> float:
+    """
+    Jittered delay (0.5x-1.5x backoff) so clients retrying the same outage
+    spread out; a numeric Retry-After from the server wins if it is longer.
+    """
+    delay = backoff * (0.5 + random.random())
+    retry_after = _retry_after(headers)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+def _price_key(offer: Dict) -> float:
+    return float(offer["price"]["total"])
+
+def _cheapest(offers, k: int) -> List[Dict]:
+    """The k cheapest offers, cheapest first (partial selection, no full sort)."""
+    return heapq.nsmallest(k, offers, key=_price_key)
+
 class AmadeusHTTPError(Exception):
-    def __init__(self, status: int, payload: dict):
+    def __init__(self, status: int, payload: dict, retry_after: Optional[float] = None):
         super().__init__(f"HTTP {status}: {payload}")
         self.status = status
         self.payload = payload
+        # server's Retry-After (seconds) when it sent one, e.g. on 429
+        self.retry_after = retry_after
 
 class AmadeusClient:
     def __init__(self):
         if not KEY or not SECRET:
             raise RuntimeError("Set AMADEUS_KEY and AMADEUS_SECRET in your .env")
         self._token = None
+        self._token_exp = 0.0
+        # one refresh at a time when the client is shared across threads
+        self._token_lock = threading.Lock()
+        # keep-alive HTTP/2 pool (thread-safe) so repeated calls skip the
+        # TCP+TLS handshake and concurrent workers multiplex one connection
+        self._http = httpx.Client(
+            base_url=BASE,
+            timeout=30,
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        )
 
     def token(self) -> str:
-        if self._token:
+        if self._token and time.time() < self._token_exp:
+            return self._token
+        with self._token_lock:
+            if self._token and time.time() < self._token_exp:
+                return self._token
+            r = self._http.post(
+                "/v1/security/oauth2/token",
+                data={"grant_type": "client_credentials", "client_id": KEY, "client_secret": SECRET},
+                timeout=20,
+            )
+            r.raise_for_status()
+            tok = r.json()
+            self._token = tok["access_token"]
+            self._token_exp = time.time() + int(tok.get("expires_in", 1799)) - TOKEN_EXPIRY_MARGIN
             return self._token
-        r = requests.post(
-            f"{BASE}/v1/security/oauth2/token",
-            data={"grant_type": "client_credentials", "client_id": KEY, "client_secret": SECRET},
-            timeout=20,
-        )
-        r.raise_for_status()
-        self._token = r.json()["access_token"]
-        return self._token
 
     def _headers(self):
         return {"Authorization": f"Bearer {self.token()}"}
@@ -41,7 +92,7 @@ class AmadeusClient:
         max_retries = kwargs.pop("max_retries", 3)
         backoff = 0.75
         for attempt in range(max_retries):
-            r = requests.request(method, url, headers=self._headers(), timeout=30, **kwargs)
+            r = self._http.request(method, url, headers=self._headers(), **kwargs)
             ct = r.headers.get("content-type", "")
             body = {}
             try:
@@ -59,14 +110,14 @@ class AmadeusClient:
                 _ = self.token()
                 continue
 
-            # 5xx → retry with backoff
+            # 5xx → retry with jittered backoff
             if 500 <= r.status_code < 600 and attempt < max_retries - 1:
-                time.sleep(backoff)
-                backoff *= 2
+                time.sleep(_retry_delay(r.headers, backoff))
+                backoff = min(backoff * 2, MAX_BACKOFF)
                 continue
 
             # Otherwise raise with payload so caller can decide
-            raise AmadeusHTTPError(r.status_code, body)
+            raise AmadeusHTTPError(r.status_code, body, _retry_after(r.headers))
 
         raise AmadeusHTTPError(599, {"error": "retry_exhausted"})
 
@@ -82,13 +133,13 @@ class AmadeusClient:
             "currencyCode": currency,
             "max": min(int(limit), 20),
         }
-        body = self._request("GET", f"{BASE}/v2/shopping/flight-offers", params=params)
+        body = self._request("GET", "/v2/shopping/flight-offers", params=params)
         return body.get("data", [])
 
     def price_confirm(self, offer: Dict) -> Dict:
         # ⚙️ MUST send the offer exactly as returned by search
         payload = {"data": {"type": "flight-offers-pricing", "flightOffers": [offer]}}
-        body = self._request("POST", f"{BASE}/v1/shopping/flight-offers/pricing",
+        body = self._request("POST", "/v1/shopping/flight-offers/pricing",
                              json=payload)
         return body["data"]["flightOffers"][0]
     
@@ -97,8 +148,8 @@ class AmadeusClient:
         Try to price-confirm up to `max_candidates` cheapest offers.
         Skips 400/4926, retries 5xx, returns the first confirmed offer.
         """
-        # sort by advertised total
-        cand = sorted(offers, key=lambda o: float(o["price"]["total"]))[:max_candidates]
+        # cheapest by advertised total
+        cand = _cheapest(offers, max_candidates)
         last_err = None
         for i, off in enumerate(cand, 1):
             try:
@@ -113,4 +164,142 @@ class AmadeusClient:
         # if none confirmed, bubble up the last error
         if last_err:
             raise last_err
-        raise RuntimeError("No offers to confirm")
\ No newline at end of file
+        raise RuntimeError("No offers to confirm")
+
+    def close(self) -> None:
+        self._http.close()
+
+
+class AsyncAmadeusClient:
+    """
+    Same API as AmadeusClient, but non-blocking: used by the FastAPI routes so
+    many in-flight Amadeus calls share one event loop (and one connection pool).
+    """
+
+    def __init__(self):
+        if not KEY or not SECRET:
+            raise RuntimeError("Set AMADEUS_KEY and AMADEUS_SECRET in your .env")
+        self._token = None
+        self._token_exp = 0.0
+        # one refresh at a time when many requests start on a cold token
+        self._token_lock = asyncio.Lock()
+        self._client = httpx.AsyncClient(
+            base_url=BASE,
+            timeout=30,
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        )
+
+    async def token(self) -> str:
+        if self._token and time.time() < self._token_exp:
+            return self._token
+        async with self._token_lock:
+            if self._token and time.time() < self._token_exp:
+                return self._token
+            r = await self._client.post(
+                "/v1/security/oauth2/token",
+                data={"grant_type": "client_credentials", "client_id": KEY, "client_secret": SECRET},
+                timeout=20,
+            )
+            r.raise_for_status()
+            tok = r.json()
+            self._token = tok["access_token"]
+            self._token_exp = time.time() + int(tok.get("expires_in", 1799)) - TOKEN_EXPIRY_MARGIN
+            return self._token
+
+    async def _headers(self):
+        return {"Authorization": f"Bearer {await self.token()}"}
+
+    # ⚙️ central request with selective retries (5xx only)
+    async def _request(self, method: str, url: str, **kwargs) -> dict:
+        max_retries = kwargs.pop("max_retries", 3)
+        backoff = 0.75
+        for attempt in range(max_retries):
+            r = await self._client.request(method, url, headers=await self._headers(), **kwargs)
+            ct = r.headers.get("content-type", "")
+            body = {}
+            try:
+                if "json" in ct:
+                    body = r.json()
+            except Exception:
+                body = {"raw": r.text[:300]}
+
+            if 200 <= r.status_code < 300:
+                return body
+
+            # 401 → refresh token once
+            if r.status_code == 401 and attempt == 0:
+                self._token = None
+                _ = await self.token()
+                continue
+
+            # 5xx → retry with jittered backoff (without blocking the loop)
+            if 500 <= r.status_code < 600 and attempt < max_retries - 1:
+                await asyncio.sleep(_retry_delay(r.headers, backoff))
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+
+            # Otherwise raise with payload so caller can decide
+            raise AmadeusHTTPError(r.status_code, body, _retry_after(r.headers))
+
+        raise AmadeusHTTPError(599, {"error": "retry_exhausted"})
+
+    async def search_offers(self, origin: str, dest: str, depart_date: str,
+                            adults: int = 1, cabin: str = "ECONOMY",
+                            currency: str = "USD", limit: int = 20) -> List[Dict]:
+        params = {
+            "originLocationCode": origin.upper(),
+            "destinationLocationCode": dest.upper(),
+            "departureDate": depart_date,  # YYYY-MM-DD
+            "adults": max(1, int(adults)),
+            "travelClass": cabin,          # ECONOMY, PREMIUM_ECONOMY, BUSINESS, FIRST
+            "currencyCode": currency,
+            "max": min(int(limit), 20),
+        }
+        body = await self._request("GET", "/v2/shopping/flight-offers", params=params)
+        return body.get("data", [])
+
+    async def price_confirm(self, offer: Dict) -> Dict:
+        # ⚙️ MUST send the offer exactly as returned by search
+        payload = {"data": {"type": "flight-offers-pricing", "flightOffers": [offer]}}
+        body = await self._request("POST", "/v1/shopping/flight-offers/pricing",
+                                   json=payload)
+        return body["data"]["flightOffers"][0]
+
+    async def try_price_confirm(self, offers, max_candidates: int = 3):
+        """
+        Try to price-confirm up to `max_candidates` cheapest offers.
+        Skips 400/4926, retries 5xx, returns the first confirmed offer.
+        """
+        cand = _cheapest(offers, max_candidates)
+        last_err = None
+        for off in cand:
+            try:
+                return await self.price_confirm(off)
+            except AmadeusHTTPError as e:
+                # unconfirmable (400/4926) or 5xx after retries: try the next offer
+                last_err = e
+                continue
+        if last_err:
+            raise last_err
+        raise RuntimeError("No offers to confirm")
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+# one AsyncAmadeusClient per process, created on first use so its connection
+# pool (and OAuth token) are shared by every caller
+_async_client = None
+
+def get_async_client() -> AsyncAmadeusClient:
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncAmadeusClient()
+    return _async_client
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
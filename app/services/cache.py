@@ -0,0 +1,93 @@
+# app/services/cache.py
+import os, time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis is optional; we fall back to an in-process cache
+    aioredis = None
+
+REDIS_URL = os.getenv("REDIS_URL")
+LOCAL_MAX_KEYS = int(os.getenv("CACHE_LOCAL_MAX_KEYS", "1024"))
+NEGATIVE_TTL = int(os.getenv("CACHE_NEGATIVE_TTL", "30"))
+
+_redis = None
+# key -> (expires_at monotonic seconds, serialized json)
+_local: Dict[str, Tuple[float, bytes]] = {}
+
+
+def _get_redis():
+    global _redis
+    if _redis is None and REDIS_URL and aioredis is not None:
+        _redis = aioredis.Redis.from_url(REDIS_URL)
+    return _redis
+
+
+def _local_get(key: str) -> Optional[bytes]:
+    hit = _local.get(key)
+    if not hit:
+        return None
+    expires_at, raw = hit
+    if expires_at < time.monotonic():
+        _local.pop(key, None)
+        return None
+    return raw
+
+
+def _local_set(key: str, raw: bytes, ttl: int) -> None:
+    now = time.monotonic()
+    if len(_local) >= LOCAL_MAX_KEYS:
+        # drop expired entries first, then the oldest insertions
+        for k in [k for k, (exp, _) in _local.items() if exp < now]:
+            del _local[k]
+        while len(_local) >= LOCAL_MAX_KEYS:
+            del _local[next(iter(_local))]
+    _local[key] = (now + ttl, raw)
+
+
+async def cache_get_json(key: str) -> Optional[Any]:
+    """
+    Return the cached value for key, or None on miss.
+    The cache is best-effort: Redis errors are treated as a miss.
+    """
+    r = _get_redis()
+    if r is None:
+        raw = _local_get(key)
+    else:
+        try:
+            raw = await r.get(key)
+        except Exception:
+            return None
+    return orjson.loads(raw) if raw else None
+
+
+async def cache_set_json(key: str, value: Any, ttl: int) -> None:
+    raw = orjson.dumps(value)
+    r = _get_redis()
+    if r is None:
+        _local_set(key, raw, ttl)
+        return
+    try:
+        await r.setex(key, ttl, raw)
+    except Exception:
+        pass
+
+
+async def cached_fetch_json(key: str, ttl: int,
+                            loader: Callable[[], Awaitable[Any]],
+                            negative_ttl: int = NEGATIVE_TTL) -> Any:
+    """
+    Return the cached value for key, or await loader() and cache its result.
+    Empty results (None, [], {}) are kept only for negative_ttl so a quiet
+    date is re-checked soon. Exceptions from loader propagate and are never
+    cached: a transient upstream failure must not poison the key.
+    """
+    hit = await cache_get_json(key)
+    if hit is not None:
+        return hit["v"]
+    value = await loader()
+    # wrapped so a cached None/[] reads back as a hit, not a miss
+    await cache_set_json(key, {"v": value}, ttl if value else negative_ttl)
+    return value
@@ -0,0 +1,55 @@
+# app/services/rate_limit.py
+import random, threading, time
+from typing import Optional
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to
+    `burst`. acquire() blocks until a token is available, so workers sharing
+    one bucket together stay under the API quota however many there are.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be > 0 and burst >= 1")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            # sleep outside the lock so other workers can check in
+            time.sleep(wait)
+
+class AdaptivePacer:
+    """
+    Pause between requests that adapts to the server: shrinks by 10% on
+    every success, doubles (plus jitter) when throttled, and never drops
+    below a Retry-After the server asked for. Callers sleep `delay` after
+    each request.
+    """
+
+    def __init__(self, initial: float, max_delay: float = 30.0):
+        self.base = initial
+        self.max_delay = max_delay
+        self.delay = initial
+
+    def success(self) -> None:
+        self.delay *= 0.9
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        # restart from at least the base pause: after a long healthy run
+        # delay is ~0 and doubling it alone would not back off
+        self.delay = min(self.max_delay, max(self.delay, self.base) * 2 + random.uniform(0, 0.25))
+        if retry_after:
+            self.delay = max(self.delay, min(retry_after, self.max_delay))
@@ -1,12 +1,47 @@
-import os, sqlite3, json
+import os, sqlite3, json, logging, queue, threading
 from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union
 import pytz
 
 EST = pytz.timezone("America/New_York")
 
 DB_PATH = os.getenv("DB_PATH", "farewatch.db")
+# fare_snapshots lives in its own file so the scheduler's snapshot writes and
+# watch/subscription writes don't queue behind SQLite's one-writer-per-file lock
+SNAPSHOTS_DB_PATH = os.getenv(
+    "SNAPSHOTS_DB_PATH", os.path.splitext(DB_PATH)[0] + "_snapshots.db"
+)
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", str((os.cpu_count() or 2) * 2)))
+# DB_TRACE_SQL=1 logs every statement SQLite runs (debug level) on every connection
+TRACE_SQL = os.getenv("DB_TRACE_SQL", "").lower() in ("1", "true", "yes")
+
+log = logging.getLogger(__name__)
+
+# applied to every connection we open (journal_mode is persisted in the file,
+# the rest are per-connection)
+#
+# synchronous=NORMAL under WAL only fsyncs at checkpoints: a power loss can
+# drop the last few committed transactions but never corrupts the file.
+# Losing a fare snapshot or two is fine; they get re-fetched next run.
+# cache_size is a cap (pages are allocated as used); mmap lets readers share
+# the OS page cache instead of copying pages into each connection's cache.
+PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA busy_timeout=5000;
+PRAGMA cache_size=-65536;
+PRAGMA mmap_size=268435456;
+PRAGMA temp_store=MEMORY;
+PRAGMA wal_autocheckpoint=1000;
+"""
+
+# the per-database subset of PRAGMAS, for the snapshots file when attached
+ATTACHED_PRAGMAS = """
+PRAGMA snap.synchronous=NORMAL;
+PRAGMA snap.cache_size=-65536;
+PRAGMA snap.mmap_size=268435456;
+"""
 
 SCHEMA = """
 PRAGMA journal_mode=WAL;
@@ -25,30 +60,34 @@ CREATE TABLE IF NOT EXISTS watches (
   created_utc TEXT NOT NULL
 );
 
-CREATE TABLE IF NOT EXISTS fare_snapshots (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  watch_id INTEGER NOT NULL,
-  seen_utc TEXT NOT NULL,
-  provider TEXT NOT NULL,
-  price_cents INTEGER NOT NULL,
-  currency TEXT NOT NULL,
-  offer_json TEXT NOT NULL,
-  FOREIGN KEY (watch_id) REFERENCES watches(id)
-);
-
-CREATE INDEX IF NOT EXISTS idx_snapshots_watch_time
-ON fare_snapshots (watch_id, seen_utc);
-
 CREATE UNIQUE INDEX IF NOT EXISTS uq_watch_route_date
 ON watches (origin, destination, depart_date, cabin, adults, currency);
 
+-- route + date range lookups (/window, get_global_min_for_window)
+CREATE INDEX IF NOT EXISTS idx_watches_route_date
+ON watches (origin, destination, depart_date);
+
+-- keyed lookups only: rows live directly in the PK b-tree
 CREATE TABLE IF NOT EXISTS global_min_alerts (
   origin TEXT NOT NULL,
   destination TEXT NOT NULL,
   last_price_cents INTEGER NOT NULL,
   last_sent_utc TEXT NOT NULL,
   PRIMARY KEY (origin, destination)
-);
+) WITHOUT ROWID;
+
+-- route/dates whose last Amadeus search came back empty; snapshot_window
+-- skips them until expires_epoch (unix seconds)
+CREATE TABLE IF NOT EXISTS empty_searches (
+  origin TEXT NOT NULL,
+  destination TEXT NOT NULL,
+  depart_date TEXT NOT NULL,
+  cabin TEXT NOT NULL,
+  adults INTEGER NOT NULL,
+  currency TEXT NOT NULL,
+  expires_epoch INTEGER NOT NULL,
+  PRIMARY KEY (origin, destination, cabin, adults, currency, depart_date)
+) WITHOUT ROWID;
 
 CREATE TABLE IF NOT EXISTS watch_subscriptions (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -59,22 +98,163 @@ CREATE TABLE IF NOT EXISTS watch_subscriptions (
   last_emailed_seen_utc TEXT,
   UNIQUE(watch_id, email)
 );
+
+-- per-watch subscriber lookups and the watches JOIN in run_scheduler.
+-- UNIQUE(watch_id, email) already covers this where present; older files
+-- built by hand may lack it.
+CREATE INDEX IF NOT EXISTS idx_subs_watch
+ON watch_subscriptions (watch_id);
+"""
+
+# fare_snapshots, in SNAPSHOTS_DB_PATH. watch_id points at watches.id in the
+# main file; SQLite can't enforce foreign keys across files.
+SNAPSHOT_SCHEMA = """
+PRAGMA journal_mode=WAL;
+
+CREATE TABLE IF NOT EXISTS fare_snapshots (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  watch_id INTEGER NOT NULL,
+  seen_utc TEXT NOT NULL,
+  seen_utc_epoch INTEGER, -- seen_utc as unix seconds, for ordering/range scans
+  provider TEXT NOT NULL,
+  price_cents INTEGER NOT NULL,
+  currency TEXT NOT NULL,
+  offer_json BLOB NOT NULL -- orjson bytes (older rows: json.dumps text); orjson.loads reads both
+);
+
+-- covering index for per-watch "latest"/min/count lookups: seek on watch_id,
+-- newest first (id breaks same-second ties), price read straight from the index
+CREATE INDEX IF NOT EXISTS idx_snapshots_watch_epoch
+ON fare_snapshots (watch_id, seen_utc_epoch DESC, id DESC, price_cents);
+
+-- per-watch price order (median by LIMIT/OFFSET in history_min_median)
+CREATE INDEX IF NOT EXISTS idx_snapshots_watch_price
+ON fare_snapshots (watch_id, price_cents);
 """
 
+# bumped by each versioned migration in init_db (kept in PRAGMA user_version)
+SCHEMA_VERSION = 3
+
+SNAPSHOT_COLUMNS = "id, watch_id, seen_utc, seen_utc_epoch, provider, price_cents, currency, offer_json"
+
+_write_conn: Optional[sqlite3.Connection] = None
+_write_lock = threading.RLock()
+_snap_write_conn: Optional[sqlite3.Connection] = None
+_snap_write_lock = threading.RLock()
+_read_pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=READ_POOL_SIZE)
+
+def _open_conn(path: str = DB_PATH, attach_snapshots: bool = False) -> sqlite3.Connection:
+    # isolation_level=None: no implicit BEGINs from the sqlite3 module;
+    # _transaction() issues BEGIN/COMMIT/ROLLBACK itself
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(PRAGMAS)
+    if attach_snapshots:
+        # unqualified "fare_snapshots" then resolves to the attached file
+        conn.execute("ATTACH DATABASE ? AS snap", (SNAPSHOTS_DB_PATH,))
+        conn.executescript(ATTACHED_PRAGMAS)
+    if TRACE_SQL:
+        conn.set_trace_callback(log.debug)
+    return conn
+
+def _get_write_conn() -> sqlite3.Connection:
+    # caller must hold _write_lock. Deliberately not attached to the
+    # snapshots file: BEGIN IMMEDIATE write-locks every attached database.
+    global _write_conn
+    if _write_conn is None:
+        _write_conn = _open_conn()
+    return _write_conn
+
+def _get_snap_write_conn() -> sqlite3.Connection:
+    # caller must hold _snap_write_lock
+    global _snap_write_conn
+    if _snap_write_conn is None:
+        _snap_write_conn = _open_conn(SNAPSHOTS_DB_PATH)
+    return _snap_write_conn
+
+@contextmanager
+def _transaction(lock, get_conn):
+    with lock:
+        conn = get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        if conn.in_transaction:
+            conn.execute("COMMIT")
+
 @contextmanager
 def connect():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """
+    The single writer connection for the main DB (watches, subscriptions,
+    alerts), serialized by a lock.
+    Each block is one transaction: COMMIT on success, ROLLBACK if it raises.
+    BEGIN IMMEDIATE takes the write lock up front, so a concurrent writer
+    in another process waits on busy_timeout instead of failing mid-block.
+    """
+    with _transaction(_write_lock, _get_write_conn) as conn:
+        yield conn
+
+@contextmanager
+def connect_snapshots():
+    """
+    Same as connect(), for the snapshots file. Snapshot inserts take this
+    file's write lock only, so they never block watch/subscription writes.
+    """
+    with _transaction(_snap_write_lock, _get_snap_write_conn) as conn:
+        yield conn
+
+@contextmanager
+def get_read_conn():
+    """
+    Borrow a read-only connection from the pool (WAL lets these run
+    alongside the writers). Opens a new one if the pool is empty.
+    The snapshots file is attached, so joins across both work as before.
+    """
+    try:
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_conn(attach_snapshots=True)
     try:
         yield conn
-        conn.commit()
     finally:
-        conn.close()
+        try:
+            _read_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def close_db() -> None:
+    """
+    Close the writers and every pooled reader. Call on process shutdown;
+    the next helper call simply reopens.
+    """
+    global _write_conn, _snap_write_conn
+    with _write_lock:
+        if _write_conn is not None:
+            _write_conn.close()
+            _write_conn = None
+    with _snap_write_lock:
+        if _snap_write_conn is not None:
+            _snap_write_conn.close()
+            _snap_write_conn = None
+    while True:
+        try:
+            _read_pool.get_nowait().close()
+        except queue.Empty:
+            break
 
 def init_db():
-    with connect() as c:
-        c.executescript(SCHEMA)
+    # journal_mode can't change inside a transaction, so the schema script
+    # runs in autocommit before the migrations below
+    with _write_lock:
+        _get_write_conn().executescript(SCHEMA)
+    with _snap_write_lock:
+        _get_snap_write_conn().executescript(SNAPSHOT_SCHEMA)
 
+    with connect() as c:
         # ---- migrations for older DBs ----
         # Ensure watch_subscriptions has the columns our code uses
         existing_cols = {
@@ -97,15 +277,182 @@ def init_db():
         if "last_emailed_seen_utc" not in existing_cols:
             c.execute("ALTER TABLE watch_subscriptions ADD COLUMN last_emailed_seen_utc TEXT;")
 
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+
+        if version < 1:
+            # v1: global_min_alerts is WITHOUT ROWID (fresh DBs already get it from SCHEMA)
+            ddl = c.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'global_min_alerts'"
+            ).fetchone()["sql"]
+            if "WITHOUT ROWID" not in ddl.upper():
+                c.execute("""
+                    CREATE TABLE global_min_alerts_new (
+                      origin TEXT NOT NULL,
+                      destination TEXT NOT NULL,
+                      last_price_cents INTEGER NOT NULL,
+                      last_sent_utc TEXT NOT NULL,
+                      PRIMARY KEY (origin, destination)
+                    ) WITHOUT ROWID
+                """)
+                c.execute("""
+                    INSERT INTO global_min_alerts_new
+                    SELECT origin, destination, last_price_cents, last_sent_utc
+                    FROM global_min_alerts
+                """)
+                c.execute("DROP TABLE global_min_alerts")
+                c.execute("ALTER TABLE global_min_alerts_new RENAME TO global_min_alerts")
+
+        # fare_snapshots still in the main file (pre-v3 DB)?
+        legacy_snapshots = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fare_snapshots'"
+        ).fetchone()
+
+        if version < 2 and legacy_snapshots:
+            # v2: integer seen_utc_epoch next to the ISO text (which stays for display)
+            snapshot_cols = {
+                row["name"]
+                for row in c.execute("PRAGMA table_info(fare_snapshots)").fetchall()
+            }
+            if "seen_utc_epoch" not in snapshot_cols:
+                c.execute("ALTER TABLE fare_snapshots ADD COLUMN seen_utc_epoch INTEGER")
+            c.execute("""
+                UPDATE fare_snapshots
+                SET seen_utc_epoch = CAST(strftime('%s', seen_utc) AS INTEGER)
+                WHERE seen_utc_epoch IS NULL
+            """)
+
+        # v3: fare_snapshots moved to SNAPSHOTS_DB_PATH (see _move_legacy_snapshots)
+
+        if version < SCHEMA_VERSION:
+            c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    if legacy_snapshots:
+        _move_legacy_snapshots()
+
+    # planner statistics, so the route/date and snapshot indexes get
+    # picked reliably. analysis_limit samples each index instead of
+    # scanning it, keeping this cheap on a large fare_snapshots table.
+    for c_ctx in (connect, connect_snapshots):
+        with c_ctx() as c:
+            c.execute("PRAGMA analysis_limit=400")
+            has_stats = c.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            ).fetchone()
+            if not has_stats:
+                # fresh file: full ANALYZE once
+                c.execute("ANALYZE")
+
+    # every start: re-analyze only the tables whose stats are stale
+    optimize()
+
+def _move_legacy_snapshots() -> None:
+    """
+    v3: fare_snapshots used to live in the main DB. Copy its rows (ids
+    included, so a retry after a crash just skips what already made it)
+    into the snapshots file, then drop the old table.
+
+    Another process (e.g. a sibling gunicorn worker running init_db) may
+    have moved the table since init_db looked, so existence is re-checked
+    once BEGIN IMMEDIATE holds the write lock on both files.
+    """
+    with _write_lock, _snap_write_lock:
+        conn = _get_snap_write_conn()
+        conn.execute("ATTACH DATABASE ? AS legacy", (DB_PATH,))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                still_there = conn.execute(
+                    "SELECT 1 FROM legacy.sqlite_master WHERE type = 'table' AND name = 'fare_snapshots'"
+                ).fetchone()
+                if not still_there:
+                    conn.execute("COMMIT")
+                    return
+                conn.execute(f"""
+                    INSERT OR IGNORE INTO main.fare_snapshots ({SNAPSHOT_COLUMNS})
+                    SELECT {SNAPSHOT_COLUMNS} FROM legacy.fare_snapshots
+                """)
+                conn.execute("DROP TABLE legacy.fare_snapshots")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.execute("DETACH DATABASE legacy")
+
+def optimize() -> None:
+    """
+    PRAGMA optimize on both files: cheap, only re-analyzes what needs it.
+    0x10000 makes it look at every table, not just ones this connection
+    happened to query (SQLite 3.46+; older versions ignore the bit).
+    """
+    with _write_lock:
+        _get_write_conn().execute("PRAGMA optimize=0x10002")
+    with _snap_write_lock:
+        _get_snap_write_conn().execute("PRAGMA optimize=0x10002")
+
+# Hot-path statements live in module constants: one canonical string per
+# statement, so the sqlite3 statement cache on our long-lived connections
+# reuses the prepared statement (and DB_TRACE_SQL shows one spelling of each).
+WATCH_ID_SQL = """
+    SELECT id
+    FROM watches
+    WHERE origin = ?
+      AND destination = ?
+      AND depart_date = ?
+      AND cabin = ?
+      AND adults = ?
+      AND currency = ?
+"""
+
+INSERT_WATCH_SQL = """
+    INSERT INTO watches
+      (origin, destination, depart_date, cabin, adults, currency, created_utc)
+    VALUES
+      (?, ?, ?, ?, ?, ?, strftime('%Y-%m-%dT%H:%M:%fZ','now'))
+"""
+
 def get_watch_id(origin, destination, depart_date, cabin="ECONOMY", adults=1, currency="USD"):
-    with connect() as c:
+    with get_read_conn() as c:
         r = c.execute(
-            """SELECT id FROM watches
-               WHERE origin=? AND destination=? AND depart_date=? AND cabin=? AND adults=? AND currency=?""",
+            WATCH_ID_SQL,
             (origin, destination, depart_date, cabin, adults, currency)
         ).fetchone()
         return r["id"] if r else None
 
+
+def ensure_watches_bulk(rows) -> Dict[tuple, int]:
+    """
+    ensure_watch for many keys in one transaction.
+    rows: iterable of (origin, destination, depart_date, cabin, adults, currency).
+    Returns {row tuple: watch_id}.
+
+    Existing ids are read in one query: the keys as a VALUES list joined to
+    watches, one uq_watch_route_date seek per key (a row-value IN scans the
+    index). Only the keys not found are inserted. INSERT ... ON CONFLICT DO
+    NOTHING would save the lookup, but every skipped key still takes a value
+    from sqlite_sequence (watches is AUTOINCREMENT) and leaves a gap in the ids.
+    """
+    keys = list(dict.fromkeys(tuple(r) for r in rows))
+    if not keys:
+        return {}
+    with connect() as c:
+        found = c.execute(
+            f"""
+            SELECT w.origin, w.destination, w.depart_date, w.cabin, w.adults, w.currency, w.id
+            FROM (VALUES {",".join(["(?,?,?,?,?,?)"] * len(keys))}) AS k
+            JOIN watches w
+              ON (w.origin, w.destination, w.depart_date, w.cabin, w.adults, w.currency)
+               = (k.column1, k.column2, k.column3, k.column4, k.column5, k.column6)
+            """,
+            [v for k in keys for v in k],
+        ).fetchall()
+        ids = {tuple(r[:6]): r[6] for r in found}
+        # the write lock is held, so nothing can insert these keys in between
+        for k in keys:
+            if k not in ids:
+                ids[k] = c.execute(INSERT_WATCH_SQL, k).lastrowid
+    return ids
+
 def ensure_watch(
     origin: str,
     destination: str,
@@ -118,16 +465,7 @@ def ensure_watch(
         c.row_factory = sqlite3.Row
 
         row = c.execute(
-            """
-            SELECT id
-            FROM watches
-            WHERE origin = ?
-              AND destination = ?
-              AND depart_date = ?
-              AND cabin = ?
-              AND adults = ?
-              AND currency = ?
-            """,
+            WATCH_ID_SQL,
             (origin, destination, depart_date, cabin, adults, currency),
         ).fetchone()
 
@@ -135,12 +473,7 @@ def ensure_watch(
             return row["id"]
 
         cur = c.execute(
-            """
-            INSERT INTO watches
-              (origin, destination, depart_date, cabin, adults, currency, created_utc)
-            VALUES
-              (?, ?, ?, ?, ?, ?, strftime('%Y-%m-%dT%H:%M:%fZ','now'))
-            """,
+            INSERT_WATCH_SQL,
             (origin, destination, depart_date, cabin, adults, currency),
         )
         return cur.lastrowid
@@ -153,100 +486,234 @@ def add_watch(origin, destination, depart_date,
             """INSERT INTO watches
                (origin,destination,depart_date,cabin,adults,currency,
                 baseline_price_cents,drop_threshold_pct,value_percentile,created_utc)
-               VALUES (?,?,?,?,?,?,?,?,?,?)""",
+               VALUES (?,?,?,?,?,?,?,?,?,strftime('%Y-%m-%dT%H:%M:%fZ','now'))""",
             (origin, destination, depart_date, cabin, adults, currency,
-             baseline_price_cents, drop_threshold_pct, value_percentile,
-             datetime.utcnow().isoformat(timespec="seconds")),
+             baseline_price_cents, drop_threshold_pct, value_percentile),
         )
         return cur.lastrowid
 
-def list_watches():
-    with connect() as c:
-        rows = c.execute(
-            """
-            SELECT
-                id,
-                origin,
-                destination,
-                depart_date,
-                cabin,
-                adults,
-                currency,
-                baseline_price_cents,
-                drop_threshold_pct,
-                value_percentile,
-                created_utc
-            FROM watches
-            ORDER BY depart_date ASC
-            """
-        ).fetchall()
-    return [dict(r) for r in rows]
-    
+def _fetch_dicts(c: sqlite3.Connection, sql: str, params=()) -> list[dict]:
+    """
+    Rows as plain dicts, built straight from tuples. Cheaper than
+    [dict(r) for r in rows] over sqlite3.Row for callers that want dicts anyway.
+    """
+    cur = c.cursor()
+    cur.row_factory = None
+    cur.execute(sql, params)
+    cols = [d[0] for d in cur.description]
+    return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+WATCH_COLUMNS = """
+    id,
+    origin,
+    destination,
+    depart_date,
+    cabin,
+    adults,
+    currency,
+    baseline_price_cents,
+    drop_threshold_pct,
+    value_percentile,
+    created_utc
+"""
 
-def append_snapshot(watch_id:int, provider:str, price_total:str, currency:str, offer_json:str):
-    cents = int(round(float(price_total) * 100))
-    with connect() as c:
-        c.execute(
-            """INSERT INTO fare_snapshots
-               (watch_id, seen_utc, provider, price_cents, currency, offer_json)
-               VALUES (?,?,?,?,?,?)""",
-            (watch_id, datetime.utcnow().isoformat(timespec="seconds"),
-             provider, cents, currency, offer_json),
+def list_watches(limit: Optional[int] = None, offset: int = 0):
+    """All watches by departure date, or one page of them (limit/offset)."""
+    with get_read_conn() as c:
+        return _fetch_dicts(
+            c,
+            f"""SELECT {WATCH_COLUMNS} FROM watches
+                ORDER BY depart_date ASC, id ASC
+                LIMIT ? OFFSET ?""",
+            (-1 if limit is None else limit, offset),
         )
 
-def latest_snapshot(watch_id:int) -> Optional[Dict[str,Any]]:
-    with connect() as c:
+def count_watches() -> int:
+    with get_read_conn() as c:
+        return c.execute("SELECT COUNT(*) FROM watches").fetchone()[0]
+
+def list_active_watches(today_iso: str):
+    """
+    Watches departing on/after today_iso (YYYY-MM-DD). depart_date is stored
+    as YYYY-MM-DD text, so a plain string comparison filters correctly.
+    """
+    with get_read_conn() as c:
+        return _fetch_dicts(
+            c,
+            f"""SELECT {WATCH_COLUMNS} FROM watches
+                WHERE depart_date >= ?
+                ORDER BY depart_date ASC""",
+            (today_iso,),
+        )
+
+# seen_utc/seen_utc_epoch are stamped by SQLite ('now' is fixed for the
+# statement, so both agree); seen_utc has the same format as the other *_utc columns
+INSERT_SNAPSHOT_SQL = """INSERT INTO fare_snapshots
+   (watch_id, seen_utc, seen_utc_epoch, provider, price_cents, currency, offer_json)
+   VALUES (?,strftime('%Y-%m-%dT%H:%M:%fZ','now'),CAST(strftime('%s','now') AS INTEGER),?,?,?,?)"""
+
+def append_snapshot(watch_id:int, provider:str, price_total:str, currency:str, offer_json:Union[bytes, str]) -> Dict[str, Any]:
+    """
+    Insert one snapshot and return the stored row (same shape as
+    latest_snapshot), read back via RETURNING rather than a second query.
+    """
+    cents = int(round(float(price_total) * 100))
+    with connect_snapshots() as c:
         row = c.execute(
-            "SELECT * FROM fare_snapshots WHERE watch_id=? ORDER BY seen_utc DESC LIMIT 1",
-            (watch_id,)
+            INSERT_SNAPSHOT_SQL + " RETURNING *",
+            (watch_id, provider, cents, currency, offer_json),
         ).fetchone()
+    return dict(row)
+
+def append_snapshots(rows) -> int:
+    """
+    Insert many snapshots in one transaction (one commit/fsync for the batch).
+    rows: iterable of (watch_id, provider, price_total, currency, offer_json),
+    same as append_snapshot's arguments. Returns the number inserted.
+    """
+    params = [
+        (watch_id, provider, int(round(float(price_total) * 100)), currency, offer_json)
+        for watch_id, provider, price_total, currency, offer_json in rows
+    ]
+    if not params:
+        return 0
+    with connect_snapshots() as c:
+        c.executemany(INSERT_SNAPSHOT_SQL, params)
+    return len(params)
+
+LATEST_SNAPSHOT_SQL = """
+    SELECT * FROM fare_snapshots
+    WHERE watch_id = ?
+    ORDER BY seen_utc_epoch DESC, id DESC
+    LIMIT 1
+"""
+
+def latest_snapshot(watch_id:int) -> Optional[Dict[str,Any]]:
+    with get_read_conn() as c:
+        row = c.execute(LATEST_SNAPSHOT_SQL, (watch_id,)).fetchone()
         return dict(row) if row else None
 
-def history_min_median(watch_id:int) -> Optional[Dict[str,int]]:
-    with connect() as c:
-        rows = c.execute(
-            "SELECT price_cents, seen_utc FROM fare_snapshots WHERE watch_id=? ORDER BY seen_utc ASC",
-            (watch_id,)
-        ).fetchall()
-    if not rows:
+WATCH_COUNT_MIN_LATEST_SQL = """
+    SELECT COUNT(*) AS n,
+           MIN(price_cents) AS min_cents,
+           (SELECT price_cents FROM fare_snapshots
+             WHERE watch_id = ?
+             ORDER BY seen_utc_epoch DESC, id DESC
+             LIMIT 1) AS latest_cents
+    FROM fare_snapshots
+    WHERE watch_id = ?
+"""
+
+# the middle one (odd n) or two (even n) prices: LIMIT 2 - n % 2 OFFSET (n - 1) / 2
+WATCH_MIDDLE_PRICES_SQL = """
+    SELECT price_cents FROM fare_snapshots
+    WHERE watch_id = ?
+    ORDER BY price_cents
+    LIMIT ? OFFSET ?
+"""
+
+def _watch_stats(c: sqlite3.Connection, watch_id: int) -> Optional[Dict[str, int]]:
+    """
+    n / min / median / latest for one watch, as index seeks: n/min/latest off
+    idx_snapshots_watch_epoch, then the middle one or two prices via
+    LIMIT/OFFSET on idx_snapshots_watch_price.
+    median = middle value (odd n) or floor of the two middle values' mean (even n);
+    latest = price with the newest seen_utc_epoch (newest id on ties).
+    """
+    row = c.execute(WATCH_COUNT_MIN_LATEST_SQL, (watch_id, watch_id)).fetchone()
+    n = row["n"]
+    if not n:
         return None
-    prices = [r["price_cents"] for r in rows]
-    prices_sorted = sorted(prices)
-    n = len(prices_sorted)
-    median = prices_sorted[n//2] if n % 2 else (prices_sorted[n//2 - 1] + prices_sorted[n//2]) // 2
-    latest_cents = rows[-1]["price_cents"]
-    return {"min_cents": prices_sorted[0], "median_cents": median, "n": n, "latest_cents": latest_cents}
+    middle = c.execute(
+        WATCH_MIDDLE_PRICES_SQL,
+        (watch_id, 2 - n % 2, (n - 1) // 2),
+    ).fetchall()
+    return {
+        "min_cents": row["min_cents"],
+        "median_cents": sum(r[0] for r in middle) // len(middle),
+        "n": n,
+        "latest_cents": row["latest_cents"],
+    }
 
-def history_for_watch(watch_id: int):
+def history_min_median(watch_id:int) -> Optional[Dict[str,int]]:
+    with get_read_conn() as c:
+        return _watch_stats(c, watch_id)
+
+def history_stats_for_watches(watch_ids) -> Dict[int, Dict[str, int]]:
     """
-    Return full price history for a watch_id as a list of dicts:
-    [{seen_utc, price_cents, currency}, ...] ordered by time.
+    history_min_median for many watches on one pooled connection.
+    Returns {watch_id: {min_cents, median_cents, n, latest_cents}}; watches
+    without snapshots are absent.
+
+    Per-watch index seeks rather than one window-function query: a window
+    pass sorts every snapshot of every watch, which on long histories costs
+    far more than the seeks (and more than pulling the rows out to reduce
+    in Python). In-process SQLite calls have no network round trip to save.
     """
-    with connect() as c:
+    stats = {}
+    with get_read_conn() as c:
+        for wid in watch_ids:
+            st = _watch_stats(c, wid)
+            if st:
+                stats[wid] = st
+    return stats
+
+def list_watches_in_window(origin: str, destination: str, start_date: str, end_date: str):
+    """
+    Watches for origin/destination departing between start_date and end_date
+    (YYYY-MM-DD, inclusive), ordered by depart_date.
+    """
+    with get_read_conn() as c:
         rows = c.execute(
-            "SELECT seen_utc, price_cents, currency "
-            "FROM fare_snapshots WHERE watch_id=? ORDER BY seen_utc ASC",
-            (watch_id,)
+            """
+            SELECT id, origin, destination, depart_date
+            FROM watches
+            WHERE origin = ? AND destination = ?
+              AND depart_date BETWEEN ? AND ?
+            ORDER BY depart_date ASC
+            """,
+            (origin, destination, start_date, end_date),
         ).fetchall()
     return [dict(r) for r in rows]
 
+def iter_history_for_watch(watch_id: int, batch_size: int = 512):
+    """
+    Full price history for a watch_id, ordered by time, streamed: yields lists
+    of {seen_utc, price_cents, currency, price_usd} dicts, batch_size rows at a time.
+    Holds a pooled read connection until the generator is exhausted or closed.
+    """
+    with get_read_conn() as c:
+        cur = c.execute(
+            "SELECT seen_utc, price_cents, currency, price_cents / 100.0 AS price_usd "
+            "FROM fare_snapshots WHERE watch_id=? ORDER BY seen_utc_epoch ASC, id ASC",
+            (watch_id,)
+        )
+        try:
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [dict(r) for r in rows]
+        finally:
+            cur.close()
+
 def get_global_min_for_window(origin: str, destination: str, start_date: str, end_date: str) -> Optional[Dict]:
     """
     Find the cheapest price across all watches for origin/destination
     whose depart_date is between start_date and end_date (YYYY-MM-DD).
     Returns a dict with watch_id, depart_date, min_cents.
+    Top-1 over the matching snapshots: no per-watch GROUP BY to materialize.
     """
-    with connect() as c:
+    with get_read_conn() as c:
         row = c.execute("""
-            SELECT w.id AS watch_id,
+            SELECT s.watch_id,
                    w.depart_date,
-                   MIN(s.price_cents) AS min_cents
+                   s.price_cents AS min_cents
             FROM watches w
             JOIN fare_snapshots s ON s.watch_id = w.id
             WHERE w.origin = ? AND w.destination = ?
               AND w.depart_date BETWEEN ? AND ?
-            GROUP BY w.id
-            ORDER BY min_cents ASC
+            ORDER BY s.price_cents ASC
             LIMIT 1
         """, (origin, destination, start_date, end_date)).fetchone()
     return dict(row) if row else None
@@ -255,7 +722,7 @@ def get_last_global_alert(origin: str, destination: str) -> Optional[int]:
     """
     Return the last_price_cents we emailed for this route, or None if never.
     """
-    with connect() as c:
+    with get_read_conn() as c:
         row = c.execute(
             "SELECT last_price_cents FROM global_min_alerts WHERE origin=? AND destination=?",
             (origin, destination)
@@ -276,22 +743,82 @@ def upsert_global_alert(origin: str, destination: str, price_cents: int):
                 last_sent_utc = excluded.last_sent_utc
         """, (origin, destination, price_cents, now))
 
-def update_last_emailed_for_watch(watch_id: int, cents: int, seen_utc: str) -> None:
+def get_empty_search_dates(origin, destination, cabin, adults, currency) -> set:
+    """Departure dates on this route still inside their empty-search TTL."""
+    with get_read_conn() as c:
+        rows = c.execute(
+            """
+            SELECT depart_date FROM empty_searches
+            WHERE origin = ? AND destination = ? AND cabin = ? AND adults = ? AND currency = ?
+              AND expires_epoch > CAST(strftime('%s','now') AS INTEGER)
+            """,
+            (origin, destination, cabin, adults, currency),
+        ).fetchall()
+    return {r[0] for r in rows}
+
+def mark_empty_searches(origin, destination, depart_dates, cabin, adults, currency, ttl_seconds: int) -> None:
+    """
+    Remember that these dates had no usable offers, for ttl_seconds.
+    Expired marks (any route) are pruned in the same transaction.
+    """
+    params = [(origin, destination, d, cabin, adults, currency, ttl_seconds) for d in depart_dates]
+    if not params:
+        return
     with connect() as c:
         c.execute(
+            "DELETE FROM empty_searches WHERE expires_epoch <= CAST(strftime('%s','now') AS INTEGER)"
+        )
+        c.executemany(
+            """
+            INSERT OR REPLACE INTO empty_searches
+              (origin, destination, depart_date, cabin, adults, currency, expires_epoch)
+            VALUES (?, ?, ?, ?, ?, ?, CAST(strftime('%s','now') AS INTEGER) + ?)
+            """,
+            params,
+        )
+
+def clear_empty_searches(origin, destination, cabin, adults, currency) -> int:
+    """Forget every empty-search mark on this route; returns rows removed."""
+    with connect() as c:
+        cur = c.execute(
             """
-            UPDATE watches
-            SET last_emailed_cents = ?, last_emailed_seen_utc = ?
-            WHERE id = ?
+            DELETE FROM empty_searches
+            WHERE origin = ? AND destination = ? AND cabin = ? AND adults = ? AND currency = ?
             """,
-            (cents, seen_utc, watch_id),
+            (origin, destination, cabin, adults, currency),
         )
-        c.commit()
+        return cur.rowcount
 
 def delete_watch_by_id(watch_id: int) -> None:
     with connect() as c:
         c.execute("DELETE FROM watches WHERE id = ?", (watch_id,))
-        c.commit()
+
+SUBSCRIPTION_ID_SQL = """
+    SELECT id
+    FROM watch_subscriptions
+    WHERE watch_id = ? AND email = ?
+"""
+
+INSERT_SUBSCRIPTION_SQL = """
+    INSERT INTO watch_subscriptions
+      (watch_id, email, created_utc)
+    VALUES
+      (?, ?, strftime('%Y-%m-%dT%H:%M:%fZ','now'))
+"""
+
+UPDATE_LAST_EMAILED_SQL = """
+    UPDATE watch_subscriptions
+    SET last_emailed_cents = ?, last_emailed_seen_utc = ?
+    WHERE id = ?
+"""
+
+SUBSCRIPTIONS_FOR_WATCH_SQL = """
+    SELECT id, email, last_emailed_cents, last_emailed_seen_utc,
+           CAST(strftime('%s', last_emailed_seen_utc) AS INTEGER) AS last_emailed_epoch
+    FROM watch_subscriptions
+    WHERE watch_id = ?
+    ORDER BY id ASC
+"""
 
 def ensure_subscription(watch_id: int, email: str) -> int:
     """
@@ -301,27 +828,12 @@ def ensure_subscription(watch_id: int, email: str) -> int:
     with connect() as c:
         c.row_factory = sqlite3.Row
 
-        row = c.execute(
-            """
-            SELECT id
-            FROM watch_subscriptions
-            WHERE watch_id = ? AND email = ?
-            """,
-            (watch_id, email),
-        ).fetchone()
+        row = c.execute(SUBSCRIPTION_ID_SQL, (watch_id, email)).fetchone()
 
         if row:
             return row["id"]
 
-        cur = c.execute(
-            """
-            INSERT INTO watch_subscriptions
-              (watch_id, email, created_utc)
-            VALUES
-              (?, ?, strftime('%Y-%m-%dT%H:%M:%fZ','now'))
-            """,
-            (watch_id, email),
-        )
+        cur = c.execute(INSERT_SUBSCRIPTION_SQL, (watch_id, email))
         return cur.lastrowid
     
 def update_subscription_last_emailed(
@@ -331,28 +843,27 @@ def update_subscription_last_emailed(
 ) -> None:
     with connect() as c:
         c.execute(
-            """
-            UPDATE watch_subscriptions
-            SET last_emailed_cents = ?, last_emailed_seen_utc = ?
-            WHERE id = ?
-            """,
+            UPDATE_LAST_EMAILED_SQL,
             (last_emailed_cents, seen_utc, subscription_id),
         )
-def get_subscriptions_for_watch(watch_id: int):
+
+def update_subscriptions_last_emailed(updates) -> None:
+    """
+    Batch form of update_subscription_last_emailed, in one transaction.
+    updates: iterable of (subscription_id, last_emailed_cents, seen_utc).
+    """
+    params = [(cents, seen_utc, sub_id) for sub_id, cents, seen_utc in updates]
+    if not params:
+        return
     with connect() as c:
-        rows = c.execute(
-            """
-            SELECT id, email, last_emailed_cents, last_emailed_seen_utc
-            FROM watch_subscriptions
-            WHERE watch_id = ?
-            ORDER BY id ASC
-            """,
-            (watch_id,),
-        ).fetchall()
+        c.executemany(UPDATE_LAST_EMAILED_SQL, params)
+def get_subscriptions_for_watch(watch_id: int):
+    with get_read_conn() as c:
+        rows = c.execute(SUBSCRIPTIONS_FOR_WATCH_SQL, (watch_id,)).fetchall()
     return [dict(r) for r in rows]
 
 def count_subscriptions_for_watch(watch_id: int) -> int:
-    with connect() as c:
+    with get_read_conn() as c:
         row = c.execute(
             "SELECT COUNT(*) AS n FROM watch_subscriptions WHERE watch_id=?",
             (watch_id,),
@@ -361,9 +872,13 @@ def count_subscriptions_for_watch(watch_id: int) -> int:
 
 def list_watches_with_stats() -> list[dict]:
     """
-    Returns watches + subscriber_count + min/median/latest/n (from fare_snapshots)
+    Returns watches + subscriber_count + min/latest/n (from fare_snapshots).
+
+    The per-watch subqueries stay correlated on purpose: each one is a seek
+    into the covering idx_snapshots_watch_epoch index, which beats a
+    window-function pass over fare_snapshots (that has to sort every row).
     """
-    with connect() as c:
+    with get_read_conn() as c:
         rows = c.execute(
             """
             SELECT
@@ -383,23 +898,28 @@ def list_watches_with_stats() -> list[dict]:
                 (SELECT fs2.price_cents
                    FROM fare_snapshots fs2
                   WHERE fs2.watch_id = w.id
-               ORDER BY fs2.seen_utc DESC
+               ORDER BY fs2.seen_utc_epoch DESC, fs2.id DESC
                   LIMIT 1) AS latest_cents
             FROM watches w
             ORDER BY w.depart_date ASC, w.id DESC
             """
         ).fetchall()
 
-    # median requires python or sqlite window funcs; if you already have history_min_median(wid), use that in API per watch.
+    # median isn't here; history_stats_for_watches() has it
     return [dict(r) for r in rows]
 
     
-def delete_subscription(watch_id: int, email: str):
+def delete_subscription(watch_id: int, email: str) -> int:
+    """
+    Remove one subscriber from a watch. Returns the number of rows deleted
+    (0 if there was no such subscription). Served by the UNIQUE(watch_id, email) index.
+    """
     with connect() as c:
-        c.execute(
+        cur = c.execute(
             """
-            DELETE FROM subscriptions
+            DELETE FROM watch_subscriptions
             WHERE watch_id = ? AND email = ?
             """,
             (watch_id, email),
         )
+        return cur.rowcount
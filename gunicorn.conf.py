@@ -0,0 +1,27 @@
+# gunicorn.conf.py
+# Production entrypoint for the API (picked up automatically from the repo root):
+#
+#   gunicorn app.api.app_api:app
+#
+# Single-process equivalent for local runs:
+#
+#   uvicorn app.api.app_api:app --loop uvloop --http httptools --backlog 4096
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Pydantic validation + JSON encoding are CPU work held under the GIL,
+# so scale out with processes: 2 x cores + 1 unless WEB_CONCURRENCY says otherwise.
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# uvicorn worker; uses uvloop + httptools when installed (uvicorn[standard])
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Import the app once in the master and fork it. Safe because the shared
+# resources (Amadeus httpx client, SendGrid client, SQLite connections) are
+# all created lazily on first use, i.e. inside each worker after the fork.
+preload_app = True
+
+# Deeper accept queue for connection bursts (the default is 2048).
+backlog = int(os.getenv("GUNICORN_BACKLOG", "4096"))
@@ -6,44 +6,58 @@ DB_PATH = Path(__file__).resolve().parents[1] / "farewatch.db"
 
 def main():
     print(f"[migrate] using db: {DB_PATH}")
-    conn = sqlite3.connect(DB_PATH)
+    # autocommit mode, so the BEGIN below is the only transaction: under the
+    # default isolation_level, sqlite3 commits implicitly around DDL
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
     try:
         conn.execute("PRAGMA foreign_keys = ON;")
 
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS watch_subscriptions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                watch_id INTEGER NOT NULL,
-                email TEXT NOT NULL,
-                created_utc TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
-                last_emailed_cents INTEGER,
-                last_emailed_seen_utc TEXT,
-                UNIQUE(watch_id, email),
-                FOREIGN KEY (watch_id) REFERENCES watches(id) ON DELETE CASCADE
-            );
-            """
-        )
-
-        # OPTIONAL: backfill old watches.alert_email into watch_subscriptions
-        rows = conn.execute(
-            "SELECT id, alert_email FROM watches WHERE alert_email IS NOT NULL AND alert_email != ''"
-        ).fetchall()
-
-        inserted = 0
-        for wid, email in rows:
-            cur = conn.execute(
+        # whole migration is one transaction: commits on success, rolls back on error
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS watch_subscriptions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    watch_id INTEGER NOT NULL,
+                    email TEXT NOT NULL,
+                    created_utc TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+                    last_emailed_cents INTEGER,
+                    last_emailed_seen_utc TEXT,
+                    UNIQUE(watch_id, email),
+                    FOREIGN KEY (watch_id) REFERENCES watches(id) ON DELETE CASCADE
+                );
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_subs_watch ON watch_subscriptions (watch_id);"
+            )
+
+            # OPTIONAL: backfill old watches.alert_email into watch_subscriptions
+            rows = conn.execute(
+                "SELECT id, alert_email FROM watches WHERE alert_email IS NOT NULL AND alert_email != ''"
+            ).fetchall()
+
+            before = conn.total_changes
+            cur = conn.executemany(
                 """
                 INSERT OR IGNORE INTO watch_subscriptions (watch_id, email)
                 VALUES (?, ?)
                 """,
-                (wid, email),
+                rows,
             )
-            inserted += cur.rowcount
+            # rowcount is the sum over all executions; fall back to total_changes if unavailable
+            inserted = cur.rowcount if cur.rowcount >= 0 else conn.total_changes - before
+        except BaseException:
+            conn.execute("ROLLBACK;")
+            raise
+        conn.execute("COMMIT;")
 
         print(f"[migrate] backfilled {inserted} subscription(s).")
 
-        conn.commit()
+        # refresh planner stats so the new index is picked up
+        conn.execute("ANALYZE watch_subscriptions;")
+
         print("[migrate] ✅ watch_subscriptions table is ready.")
     finally:
         conn.close()
@@ -1,6 +1,8 @@
 import sqlite3, pandas as pd, matplotlib.pyplot as plt
 
 conn = sqlite3.connect("farewatch.db")
+# snapshots live in their own file next to the main DB (see app/store/db.py)
+conn.execute("ATTACH DATABASE 'farewatch_snapshots.db' AS snap")
 df = pd.read_sql("""
 SELECT w.origin, w.destination, w.depart_date, s.seen_utc, s.price_cents/100.0 AS price
 FROM fare_snapshots s JOIN watches w ON w.id=s.watch_id
@@ -8,7 +10,8 @@ ORDER BY w.depart_date, s.seen_utc
 """, conn)
 
 for (route, dep), group in df.groupby(["destination","depart_date"]):
-    plt.plot(pd.to_datetime(group["seen_utc"]), group["price"], label=dep)
+    # seen_utc mixes older naive timestamps with ...Z ones; both are UTC
+    plt.plot(pd.to_datetime(group["seen_utc"], format="ISO8601", utc=True), group["price"], label=dep)
 
 plt.title("BWI→SFO Price History")
 plt.xlabel("Snapshot Time")
@@ -1,15 +1,20 @@
 import os
 import sys
-import json
+import asyncio
+import time
 import logging
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
+from itertools import groupby
+
+import orjson
 
 # Make "app." imports work when run as a script
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from app.store import db
 from app.logic.deals import is_new_low, search_best_offer_for_watch
-from app.notifiers.emailer import send_email
+from app.notifiers.emailer import send_emails
+from app.services.amadeus_client import close_async_client
 
 log = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -17,34 +22,73 @@ logging.basicConfig(level=logging.INFO)
 # Minimum time between emails to the same subscription (anti-spam)
 MIN_HOURS_BETWEEN_ALERTS = 6
 
+# Max Amadeus lookups in flight at once (keeps us under the API rate limit)
+AMADEUS_CONCURRENCY = int(os.getenv("AMADEUS_CONCURRENCY", "8"))
+
 
 def utcnow_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 
+SUB_COLUMNS = ("id", "email", "last_emailed_cents", "last_emailed_seen_utc", "last_emailed_epoch")
+
+
 def fetch_watches_with_subscribers() -> list[dict]:
     """
     Only process watches that have at least one subscription.
+    Watches and their subscriptions come back in one JOIN; each watch dict
+    carries its subs under "subscriptions" (same shape as
+    db.get_subscriptions_for_watch) so alerting doesn't re-query per watch.
     """
-    with db.connect() as c:
+    with db.get_read_conn() as c:
         rows = c.execute(
             """
-            SELECT DISTINCT w.*
+            SELECT w.*,
+                   s.id AS sub_id,
+                   s.email AS sub_email,
+                   s.last_emailed_cents AS sub_last_emailed_cents,
+                   s.last_emailed_seen_utc AS sub_last_emailed_seen_utc,
+                   CAST(strftime('%s', s.last_emailed_seen_utc) AS INTEGER) AS sub_last_emailed_epoch
             FROM watches w
             JOIN watch_subscriptions s ON s.watch_id = w.id
-            ORDER BY w.depart_date ASC, w.id DESC
+            ORDER BY w.depart_date ASC, w.id DESC, s.id ASC
             """
         ).fetchall()
-    return [dict(r) for r in rows]
+
+    watches: list[dict] = []
+    for _, group in groupby(rows, key=lambda r: r["id"]):
+        group = list(group)
+        watch = {k: group[0][k] for k in group[0].keys() if not k.startswith("sub_")}
+        watch["subscriptions"] = [
+            {col: r[f"sub_{col}"] for col in SUB_COLUMNS} for r in group
+        ]
+        watches.append(watch)
+    return watches
+
+
+async def fetch_best_offers(watches: list[dict]) -> list[dict | None]:
+    """
+    Look up the best current offer for every watch concurrently,
+    at most AMADEUS_CONCURRENCY requests in flight. Results line up with `watches`.
+    """
+    sem = asyncio.Semaphore(AMADEUS_CONCURRENCY)
+
+    async def one(watch: dict) -> dict | None:
+        async with sem:
+            return await search_best_offer_for_watch(watch)
+
+    try:
+        return await asyncio.gather(*(one(w) for w in watches))
+    finally:
+        await close_async_client()
 
 
-def take_snapshot_for_watch(watch: dict) -> dict | None:
+def take_snapshot_for_watch(watch: dict, offer: dict | None) -> dict | None:
     """
-    1) Call Amadeus / deals logic to get the best current offer
+    1) Take the best current offer (from fetch_best_offers)
     2) Append to fare_snapshots
-    3) Return the latest snapshot row for this watch
+    3) Return the stored snapshot row (no re-query)
     """
-    offer = search_best_offer_for_watch(watch)
     if not offer:
         log.info("No offer found for watch %s", watch["id"])
         return None
@@ -53,9 +97,9 @@ def take_snapshot_for_watch(watch: dict) -> dict | None:
     currency = offer.get("currency", watch["currency"])
     provider = offer.get("provider", "amadeus")
     raw = offer.get("raw_json", offer)
-    offer_json = raw if isinstance(raw, str) else json.dumps(raw)
+    offer_json = raw if isinstance(raw, (str, bytes)) else orjson.dumps(raw)
 
-    db.append_snapshot(
+    return db.append_snapshot(
         watch_id=watch["id"],
         provider=provider,
         price_total=price_total,
@@ -63,24 +107,23 @@ def take_snapshot_for_watch(watch: dict) -> dict | None:
         offer_json=offer_json,
     )
 
-    return db.latest_snapshot(watch["id"])
 
-
-def should_send_email(sub: dict, watch: dict, latest_snapshot: dict) -> bool:
+def should_send_email(sub: dict, watch: dict, latest_snapshot: dict, low_info) -> bool:
     """
     Decide if we should email this subscription.
 
     Rules:
-      1. Must be a new low overall (is_new_low).
+      1. Must be a new low overall (low_info = is_new_low(watch["id"]),
+         computed once per watch by the caller).
       2. Must beat this subscriber's last_emailed_cents (if any).
       3. Respect MIN_HOURS_BETWEEN_ALERTS.
     """
     current_price = latest_snapshot["price_cents"]
     last_price = sub.get("last_emailed_cents")
-    last_seen_str = sub.get("last_emailed_seen_utc")
+    # unix seconds, parsed by SQLite; None if never emailed (or unparseable)
+    last_epoch = sub.get("last_emailed_epoch")
 
     # 1) Require a "new low" overall for this watch
-    low_info = is_new_low(watch["id"])
     if not low_info:
         return False
 
@@ -89,14 +132,8 @@ def should_send_email(sub: dict, watch: dict, latest_snapshot: dict) -> bool:
         return False
 
     # 3) Time throttle per subscription (anti-spam)
-    if last_seen_str:
-        try:
-            last_seen = datetime.fromisoformat(last_seen_str)
-            if datetime.now(timezone.utc) - last_seen < timedelta(hours=MIN_HOURS_BETWEEN_ALERTS):
-                return False
-        except Exception:
-            # If parsing fails, ignore and treat as "no last email"
-            pass
+    if last_epoch is not None and time.time() - last_epoch < MIN_HOURS_BETWEEN_ALERTS * 3600:
+        return False
 
     return True
 
@@ -124,31 +161,39 @@ def format_email(watch: dict, snapshot: dict) -> tuple[str, str]:
 
 
 def send_alerts_for_watch(watch: dict, latest_snapshot: dict) -> None:
-    subs = db.get_subscriptions_for_watch(watch["id"])
+    subs = watch.get("subscriptions")
+    if subs is None:
+        subs = db.get_subscriptions_for_watch(watch["id"])
     if not subs:
         return
 
-    for sub in subs:
-        if not should_send_email(sub, watch, latest_snapshot):
-            continue
+    # same answer for every subscriber on this watch
+    low_info = is_new_low(watch["id"])
+    if not low_info:
+        return
 
-        subject, body = format_email(watch, latest_snapshot)
-        send_email(subject=subject, body=body, email_to=sub["email"])
+    to_notify = [sub for sub in subs if should_send_email(sub, watch, latest_snapshot, low_info)]
+    if not to_notify:
+        return
+
+    # Same alert for everyone on this watch → one SendGrid call
+    subject, body = format_email(watch, latest_snapshot)
+    send_emails(subject=subject, body=body, recipients=[sub["email"] for sub in to_notify])
 
-        # Update per-subscription "last emailed" so we don't double send
-        db.update_subscription_last_emailed(
-            subscription_id=sub["id"],
-            last_emailed_cents=latest_snapshot["price_cents"],
-            seen_utc=latest_snapshot["seen_utc"],
-        )
+    # Update per-subscription "last emailed" so we don't double send
+    # (one transaction for every recipient)
+    db.update_subscriptions_last_emailed(
+        (sub["id"], latest_snapshot["price_cents"], latest_snapshot["seen_utc"])
+        for sub in to_notify
+    )
 
 
-def process_watch(watch: dict) -> None:
+def process_watch(watch: dict, offer: dict | None) -> None:
     """
     Full pipeline for one watch: take snapshot + maybe send emails.
     """
     try:
-        latest = take_snapshot_for_watch(watch)
+        latest = take_snapshot_for_watch(watch, offer)
         if not latest:
             return
         send_alerts_for_watch(watch, latest)
@@ -160,11 +205,17 @@ def main():
     log.info("Scheduler run started at %s", utcnow_iso())
     db.init_db()  # safe if schema already exists + runs migrations
 
-    watches = fetch_watches_with_subscribers()
-    log.info("Found %d watches with subscriptions", len(watches))
+    try:
+        watches = fetch_watches_with_subscribers()
+        log.info("Found %d watches with subscriptions", len(watches))
+
+        offers = asyncio.run(fetch_best_offers(watches))
 
-    for watch in watches:
-        process_watch(watch)
+        for watch, offer in zip(watches, offers):
+            process_watch(watch, offer)
+    finally:
+        db.optimize()
+        db.close_db()
 
     log.info("Scheduler run finished at %s", utcnow_iso())
 
@@ -4,26 +4,37 @@ import sys
 # allow imports from parent directories (app/)
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-import json
-import time
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timezone
+from typing import List, Optional, Tuple
 from app.services.amadeus_client import AmadeusClient, AmadeusHTTPError
+from app.services.rate_limit import TokenBucket
 
 from app.store.db import (
-    list_watches,
-    append_snapshot,
+    list_active_watches,
+    append_snapshots,
     history_min_median,
     get_subscriptions_for_watch,
-    update_subscription_last_emailed
+    update_subscriptions_last_emailed
 )
 from app.logic.deals import drop_pct
-from app.notifiers.emailer import send_email  # your existing email helper
+from app.notifiers.emailer import send_emails  # your existing email helper
 
 
-SLEEP_BETWEEN = float(os.getenv("SNAPSHOT_SLEEP_BETWEEN", "1.0"))  # seconds
+RATE_QPS = float(os.getenv("AMADEUS_RATE_QPS", "10"))             # Amadeus calls/sec, all workers
+RATE_BURST = int(os.getenv("AMADEUS_RATE_BURST", "1"))             # calls allowed back-to-back
+SNAPSHOT_WORKERS = int(os.getenv("SNAPSHOT_WORKERS", "4"))          # watches fetched in parallel
 NEW_LOW_DROP_PCT = float(os.getenv("NEW_LOW_DROP_PCT", "15.0"))    # % below median for info logging
 
-def snapshot_single_watch(client: AmadeusClient, w: dict) -> None:
+# shared by every worker, so the pool as a whole stays under the quota
+BUCKET = TokenBucket(RATE_QPS, RATE_BURST)
+
+def fetch_confirmed_offer(client: AmadeusClient, w: dict) -> Optional[dict]:
+    """
+    Search + price-confirm the cheapest bookable offer for a watch.
+    Returns the confirmed offer, or None if there is nothing to save.
+    """
     wid = w["id"]
     origin = w["origin"]
     dest = w["destination"]
@@ -33,6 +44,7 @@ def snapshot_single_watch(client: AmadeusClient, w: dict) -> None:
     currency = w.get("currency", "USD")
 
     try:
+        BUCKET.acquire()
         offers = client.search_offers(
             origin=origin,
             dest=dest,
@@ -44,21 +56,26 @@ def snapshot_single_watch(client: AmadeusClient, w: dict) -> None:
         )
     except AmadeusHTTPError as e:
         print(f"[watch {wid} {origin}->{dest} {depart_date}] HTTP {e.status}: {e.payload} (skipping)")
-        return
+        return None
     except Exception as e:
         print(f"[watch {wid} {origin}->{dest} {depart_date}] unexpected error: {e}")
-        return
+        return None
 
     if not offers:
         print(f"[watch {wid} {origin}->{dest} {depart_date}] no offers (skipping)")
-        return
+        return None
 
     # sort offers cheapest → most expensive
-    offers_sorted = sorted(offers, key=lambda o: float(o["price"]["total"]))
+    try:
+        offers_sorted = sorted(offers, key=lambda o: float(o["price"]["total"]))
+    except Exception as e:
+        print(f"[watch {wid} {origin}->{dest} {depart_date}] malformed offer price: {e!r} (skipping)")
+        return None
 
     confirmed = None
     for offer in offers_sorted:
         try:
+            BUCKET.acquire()
             confirmed = client.price_confirm(offer)
             break
         except AmadeusHTTPError as e:
@@ -72,32 +89,37 @@ def snapshot_single_watch(client: AmadeusClient, w: dict) -> None:
                 f"[watch {wid} {origin}->{dest} {depart_date}] "
                 f"unexpected pricing error {e.status}: {e.payload} (skipping watch)"
             )
-            return
+            return None
+        except Exception as e:
+            # e.g. a timeout: skip this watch, the rest of the run still gets saved
+            print(
+                f"[watch {wid} {origin}->{dest} {depart_date}] "
+                f"unexpected pricing error: {e!r} (skipping watch)"
+            )
+            return None
 
     if confirmed is None:
         print(
             f"[watch {wid} {origin}->{dest} {depart_date}] "
             "all offers failed pricing (No fare applicable). Skipping."
         )
-        return
-
-    price_total = float(confirmed["price"]["total"])
-    price_curr = confirmed["price"]["currency"]
-    seen_utc = datetime.now(timezone.utc).isoformat(timespec="seconds")
-
-    append_snapshot(
-        wid,
-        "amadeus",
-        price_total,
-        price_curr,
-        json.dumps(confirmed),
-    )
-    print(f"[watch {wid} {origin}->{dest} {depart_date}] saved: ${price_total:.2f} {price_curr}")
+    return confirmed
+
+def notify_subscribers(w: dict, seen_utc: str) -> List[Tuple[int, int, str]]:
+    """
+    Email subscribers of a watch whose latest snapshot is a new best for them.
+    Returns (subscription_id, cents, seen_utc) updates for the caller to
+    write back in one batch.
+    """
+    wid = w["id"]
+    origin = w["origin"]
+    dest = w["destination"]
+    depart_date = w["depart_date"]
 
     # --- STATS for this watch
     stats = history_min_median(wid)
     if not stats:
-        return
+        return []
 
     latest_cents = stats["latest_cents"]
     latest_usd = latest_cents / 100.0
@@ -114,10 +136,10 @@ def snapshot_single_watch(client: AmadeusClient, w: dict) -> None:
 
     if not subs:
         print(f"[watch {wid}] no subscribers; skipping email send.")
-        return
+        return []
 
+    to_notify = []
     for sub in subs:
-        sub_id = sub["id"]
         email_to = sub["email"]
         last_emailed_cents = sub.get("last_emailed_cents")
 
@@ -126,46 +148,65 @@ def snapshot_single_watch(client: AmadeusClient, w: dict) -> None:
             print(f"[watch {wid}] {email_to} already emailed <= this price; skipping.")
             continue
 
-        subject = f"[Farewatch] New best price {origin}->{dest} {depart_date}: ${latest_usd:.2f}"
-        body = (
-            f"New best observed price for {origin}->{dest} on {depart_date}:\n"
-            f"  Current price: ${latest_usd:.2f}\n"
-            f"  Median so far: ${median_usd:.2f} ({dp:.1f}% below median)\n"
-            f"  Snapshots so far: {stats['n']}\n\n"
-            "If this looks good, consider booking soon."
-        )
+        to_notify.append(sub)
 
-        send_email(subject, body, email_to)
-        print(f"[watch {wid}] email sent to {email_to}")
+    if not to_notify:
+        return []
+
+    subject = f"[Farewatch] New best price {origin}->{dest} {depart_date}: ${latest_usd:.2f}"
+    body = (
+        f"New best observed price for {origin}->{dest} on {depart_date}:\n"
+        f"  Current price: ${latest_usd:.2f}\n"
+        f"  Median so far: ${median_usd:.2f} ({dp:.1f}% below median)\n"
+        f"  Snapshots so far: {stats['n']}\n\n"
+        "If this looks good, consider booking soon."
+    )
 
-        update_subscription_last_emailed(sub_id, latest_cents, seen_utc)
-        print(f"[watch {wid}] subscription {sub_id} last_emailed updated.")
+    # one SendGrid call for every subscriber on this watch
+    send_emails(subject, body, [sub["email"] for sub in to_notify])
+    print(f"[watch {wid}] email sent to {len(to_notify)} subscriber(s)")
+
+    return [(sub["id"], latest_cents, seen_utc) for sub in to_notify]
 
 def main() -> None:
     client = AmadeusClient()
-    watches = list_watches()
+    # past departures are filtered out in SQL
+    watches = list_active_watches(date.today().isoformat())
     print(f"[snapshot_all] running for {len(watches)} watches")
     if not watches:
-        print("[snapshot_all] no watches in DB, nothing to do")
+        print("[snapshot_all] no upcoming watches in DB, nothing to do")
         return
 
-    today = date.today()
-    print(f"[snapshot_all] running for {len(watches)} watches")
-
-    for w in watches:
-        # Skip past departures
-        try:
-            depart = datetime.strptime(w["depart_date"], "%Y-%m-%d").date()
-        except ValueError:
-            print(f"[watch {w['id']}] bad depart_date '{w['depart_date']}' – skipping")
-            continue
-
-        if depart < today:
-            print(f"[watch {w['id']}] {w['depart_date']} is in the past – skipping")
-            continue
+    # Amadeus calls are network-bound, so fetch several watches at once.
+    # Workers only talk HTTP (the client is thread-safe); every DB write
+    # happens below, on this thread.
+    try:
+        with ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS) as pool:
+            results = list(pool.map(lambda w: fetch_confirmed_offer(client, w), watches))
+    finally:
+        client.close()
+    fetched = [(w, c) for w, c in zip(watches, results) if c is not None]  # (watch, confirmed offer)
+
+    # one transaction for every snapshot of this run
+    append_snapshots(
+        (w["id"], "amadeus", c["price"]["total"], c["price"]["currency"], orjson.dumps(c))
+        for w, c in fetched
+    )
+    for w, c in fetched:
+        print(
+            f"[watch {w['id']} {w['origin']}->{w['destination']} {w['depart_date']}] "
+            f"saved: ${float(c['price']['total']):.2f} {c['price']['currency']}"
+        )
 
-        snapshot_single_watch(client, w)
-        time.sleep(SLEEP_BETWEEN)
+    seen_utc = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    updates = []
+    for w, _ in fetched:
+        updates.extend(notify_subscribers(w, seen_utc))
+
+    # ...and one for every subscription we emailed
+    update_subscriptions_last_emailed(updates)
+    if updates:
+        print(f"[snapshot_all] last_emailed updated for {len(updates)} subscription(s)")
 
 if __name__ == "__main__":
     main()
@@ -1,14 +1,19 @@
 # scripts/snapshot_window.py
-import os, sys, json, time
+import os, sys, asyncio, heapq
+import orjson
 from datetime import date, timedelta
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from dotenv import load_dotenv
-from app.services.amadeus_client import AmadeusClient, AmadeusHTTPError
-from app.store.db import init_db, ensure_watch, append_snapshot
-from app.logic.deals import is_new_low, drop_pct
-from app.store.db import history_min_median
+from app.services.amadeus_client import AmadeusHTTPError, get_async_client, close_async_client
+from app.services.cache import cached_fetch_json
+from app.services.rate_limit import AdaptivePacer
+from app.store.db import (
+    init_db, ensure_watches_bulk, append_snapshots, history_stats_for_watches,
+    get_empty_search_dates, mark_empty_searches, clear_empty_searches,
+)
+from app.logic.deals import is_new_low_from_stats, drop_pct
 
 load_dotenv()
 
@@ -20,10 +25,105 @@ CURRENCY = os.getenv("CURRENCY", "USD").upper()
 
 START_OFFSET_DAYS = int(os.getenv("START_OFFSET_DAYS", "30"))
 WINDOW_DAYS       = int(os.getenv("WINDOW_DAYS", "50"))
-SLEEP_BETWEEN     = float(os.getenv("SLEEP_BETWEEN", "0.5"))
+SLEEP_BETWEEN     = float(os.getenv("SLEEP_BETWEEN", "0.5"))   # starting pause per request slot (adapts)
+MAX_CONCURRENCY   = int(os.getenv("MAX_CONCURRENCY", "8"))      # dates in flight
 MAX_CANDIDATES    = int(os.getenv("MAX_CANDIDATES", "3"))
+AMADEUS_CACHE_TTL = int(os.getenv("AMADEUS_CACHE_TTL", "600"))  # reruns reuse recent search results (needs REDIS_URL)
+EMPTY_SEARCH_TTL  = int(os.getenv("EMPTY_SEARCH_TTL", "300"))   # skip no-offer dates this long (--refresh clears)
 
 VALID_CLASSES = {"ECONOMY","PREMIUM_ECONOMY","BUSINESS","FIRST"}
+# statuses that mean "slow down" rather than "this date is bad"
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+def _usd(cents: int) -> str:
+    d, r = divmod(cents, 100)
+    return f"${d}.{r:02d}"
+
+def _iter_valid(offers):
+    """Offers with a price total and at least one itinerary."""
+    for o in offers:
+        p = o.get("price")
+        if p and "total" in p and o.get("itineraries"):
+            yield o
+
+async def fetch_confirmed(ama, depart_str: str, empty: set, pacer: AdaptivePacer):
+    """
+    Search one departure date and price-confirm the cheapest usable offer.
+    Returns the confirmed offer, or None if there is nothing to save; dates
+    with no usable offers are added to `empty`. Successes and throttling
+    errors are reported to `pacer`. The search may be served from the cache
+    (a rerun within AMADEUS_CACHE_TTL); confirmation never is, so every
+    returned offer is a live price and is saved as a new snapshot.
+    """
+    key = f"{ORIGIN}:{DEST}:{depart_str}:{CABIN}:{ADULTS}:{CURRENCY}"
+    try:
+        offers = await cached_fetch_json(
+            f"amadeus:offers:{key}", AMADEUS_CACHE_TTL,
+            lambda: ama.search_offers(ORIGIN, DEST, depart_str,
+                                      adults=ADULTS, cabin=CABIN,
+                                      currency=CURRENCY, limit=10),
+        )
+        if not offers:
+            print(f"[{depart_str}] no offers (skipping)")
+            empty.add(depart_str)
+            return None
+
+        # hygiene + cheapest-K in one pass: broken items never reach the heap
+        cand = heapq.nsmallest(MAX_CANDIDATES, _iter_valid(offers),
+                               key=lambda o: float(o["price"]["total"]))
+        if not cand:
+            print(f"[{depart_str}] offers returned but unusable (skip)")
+            empty.add(depart_str)
+            return None
+
+        #  key change: try up to MAX_CANDIDATES cheapest until one confirms
+        confirmed = await ama.try_price_confirm(cand, max_candidates=MAX_CANDIDATES)
+        # counted on the confirm: the search above may not have hit Amadeus
+        pacer.success()
+        return confirmed
+    except AmadeusHTTPError as e:
+        if e.status in THROTTLE_STATUSES:
+            pacer.throttled(e.retry_after)
+        print(f"[{depart_str}] HTTP {e.status} → {e.payload} (skip)")
+    except Exception as ex:
+        print(f"[{depart_str}] unexpected error: {ex}")
+    return None
+
+async def _watch_stop(stop: asyncio.Event) -> None:
+    """Set `stop` once a STOP file appears; one stat per second, off the loop."""
+    while not stop.is_set():
+        if await asyncio.to_thread(os.path.exists, "STOP"):
+            stop.set()
+        else:
+            await asyncio.sleep(1.0)
+
+async def fetch_window(depart_strs, empty: set):
+    """
+    Scan every date concurrently, at most MAX_CONCURRENCY in flight; each
+    slot pauses after its request for the pacer's current delay (starts at
+    SLEEP_BETWEEN, shrinks while Amadeus is healthy, backs off on 429/5xx).
+    Results line up with `depart_strs`.
+    """
+    ama = get_async_client()
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    pacer = AdaptivePacer(SLEEP_BETWEEN)
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(_watch_stop(stop))
+
+    async def bound_fetch(depart_str):
+        async with sem:
+            if stop.is_set():
+                return None
+            try:
+                return await fetch_confirmed(ama, depart_str, empty, pacer)
+            finally:
+                await asyncio.sleep(pacer.delay)
+
+    try:
+        return await asyncio.gather(*(bound_fetch(ds) for ds in depart_strs))
+    finally:
+        watcher.cancel()
+        await close_async_client()
 
 def main():
     if os.path.exists("STOP"):
@@ -39,68 +139,69 @@ def main():
         return
 
     init_db()
-    ama = AmadeusClient()
 
     start = date.today() + timedelta(days=START_OFFSET_DAYS)
-    targets = [start + timedelta(days=i) for i in range(WINDOW_DAYS)]
-    print(f"Scanning {ORIGIN}->{DEST} for {len(targets)} dates starting {start.isoformat()}")
-
-    for d in targets:
-        if os.path.exists("STOP"):
-            print("STOP present; stopping mid-loop.")
-            return
-
-        depart_str = d.isoformat()
-        try:
-            offers = ama.search_offers(ORIGIN, DEST, depart_str,
-                                       adults=ADULTS, cabin=CABIN,
-                                       currency=CURRENCY, limit=10)
-            if not offers:
-                print(f"[{depart_str}] no offers (skipping)")
-                time.sleep(SLEEP_BETWEEN); continue
-
-            # OPTIONAL hygiene: drop obviously broken items
-            offers = [o for o in offers if "price" in o and "total" in o["price"] and o.get("itineraries")]
-            if not offers:
-                print(f"[{depart_str}] offers returned but unusable (skip)")
-                time.sleep(SLEEP_BETWEEN); continue
-
-            #  key change: try up to MAX_CANDIDATES cheapest until one confirms
-            confirmed = ama.try_price_confirm(offers, max_candidates=MAX_CANDIDATES)
-
-            wid = ensure_watch(ORIGIN, DEST, depart_str, CABIN, ADULTS, CURRENCY)
-            append_snapshot(
-                wid, "amadeus",
-                confirmed["price"]["total"], confirmed["price"]["currency"],
-                json.dumps(confirmed)
-            )
-            print(f"[{depart_str}] saved: ${confirmed['price']['total']} {confirmed['price']['currency']}")
-            
-            # -------- Deal checks (console alerts + email) --------
-            stats = history_min_median(wid)
-            if stats:
-                latest = stats["latest_cents"]
-
-                # 🔥 new all-time low?
-                nl = is_new_low(wid)
-                if nl:
-                    msg = f"NEW LOW {ORIGIN}->{DEST} on {depart_str}: ${latest/100:.2f} (n={stats['n']})"
-                    print("🔥", msg)
-
-                # 💡 drop vs median (optional for now – console only)
-                dp = drop_pct(stats["median_cents"], latest)
-                if dp >= 15:
-                    print(f"💡 {depart_str} is {dp:.1f}% below median: "
-                        f"${latest/100:.2f} vs ${stats['median_cents']/100:.2f}")
-
-            
-                
-        except AmadeusHTTPError as e:
-            print(f"[{depart_str}] HTTP {e.status} → {e.payload} (skip)")
-        except Exception as ex:
-            print(f"[{depart_str}] unexpected error: {ex}")
-        finally:
-            time.sleep(SLEEP_BETWEEN)
+    # YYYY-MM-DD once per date; everything downstream keys on the string
+    depart_strs = [(start + timedelta(days=i)).isoformat() for i in range(WINDOW_DAYS)]
+    print(f"Scanning {ORIGIN}->{DEST} for {len(depart_strs)} dates starting {start.isoformat()}")
+
+    route = (ORIGIN, DEST, CABIN, ADULTS, CURRENCY)
+    if "--refresh" in sys.argv[1:]:
+        print(f"--refresh: cleared {clear_empty_searches(*route)} empty-search mark(s)")
+    # dates that just came back empty aren't worth another API call yet
+    skip = get_empty_search_dates(*route)
+    if skip:
+        depart_strs = [ds for ds in depart_strs if ds not in skip]
+        print(f"Skipping {len(skip)} date(s) with no offers in the last {EMPTY_SEARCH_TTL}s")
+
+    # Amadeus calls overlap; every DB write below stays on this thread
+    empty = set()
+    results = asyncio.run(fetch_window(depart_strs, empty))
+    if os.path.exists("STOP"):
+        print("STOP present; saving what was fetched.")
+    mark_empty_searches(ORIGIN, DEST, sorted(empty), CABIN, ADULTS, CURRENCY, EMPTY_SEARCH_TTL)
+
+    fetched = [(ds, c) for ds, c in zip(depart_strs, results) if c is not None]
+    if not fetched:
+        return
+
+    # watch ids for every saved date in one transaction (inserting new ones)
+    wid_by_date = {
+        key[2]: wid
+        for key, wid in ensure_watches_bulk(
+            (ORIGIN, DEST, ds, CABIN, ADULTS, CURRENCY) for ds, _ in fetched
+        ).items()
+    }
+
+    # one transaction for every snapshot of this run
+    append_snapshots(
+        (wid_by_date[ds], "amadeus", c["price"]["total"], c["price"]["currency"], orjson.dumps(c))
+        for ds, c in fetched
+    )
+    for depart_str, confirmed in fetched:
+        print(f"[{depart_str}] saved: ${confirmed['price']['total']} {confirmed['price']['currency']}")
+
+    # -------- Deal checks (console alerts + email) --------
+    # stats for every saved date in one pass; new-low/drop are derived from them
+    all_stats = history_stats_for_watches(wid_by_date[ds] for ds, _ in fetched)
+    for depart_str, _ in fetched:
+        wid = wid_by_date[depart_str]
+        stats = all_stats.get(wid)
+        if not stats:
+            continue
+        latest = stats["latest_cents"]
+
+        # 🔥 new all-time low?
+        nl = is_new_low_from_stats(stats)
+        if nl:
+            msg = f"NEW LOW {ORIGIN}->{DEST} on {depart_str}: {_usd(latest)} (n={stats['n']})"
+            print("🔥", msg)
+
+        # 💡 drop vs median (optional for now – console only)
+        dp = drop_pct(stats["median_cents"], latest)
+        if dp >= 15:
+            print(f"💡 {depart_str} is {dp:.1f}% below median: "
+                f"{_usd(latest)} vs {_usd(stats['median_cents'])}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
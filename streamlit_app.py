@@ -1,6 +1,9 @@
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
 
 DEFAULT_API_BASE = "https://farewatch.onrender.com"
 
@@ -8,27 +11,108 @@ DEFAULT_API_BASE = "https://farewatch.onrender.com"
 # -----------------------------
 # HTTP helpers
 # -----------------------------
-def api_get(path: str, api_base: str, params: dict | None = None):
-    r = requests.get(f"{api_base}{path}", params=params, timeout=30)
+# one keep-alive pool for the process: the script body re-executes on every
+# rerun, so a plain module-level Session would be rebuilt each time
+@st.cache_resource
+def _session() -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+# Streamlit reruns the whole script on every widget change, so GETs are
+# memoized for a short while; a successful write (watch, subscribe,
+# unsubscribe) drops the memo.
+def _fetch(path: str, api_base: str, params: tuple = (), session: requests.Session | None = None):
+    r = (session or _session()).get(f"{api_base}{path}", params=dict(params), timeout=30)
     is_json = r.headers.get("content-type", "").startswith("application/json")
     return r.status_code, (r.json() if is_json else r.text)
 
 
-def api_post(path: str, api_base: str, payload: dict):
-    r = requests.post(f"{api_base}{path}", json=payload, timeout=60)
+# carries an error response out of a cached GET: st.cache_data doesn't store
+# a call that raises, so a 404/5xx isn't replayed for the whole ttl
+class _Uncached(Exception):
+    def __init__(self, result):
+        super().__init__(result)
+        self.result = result
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _raw_get(path: str, api_base: str, params: tuple):
+    result = _fetch(path, api_base, params)
+    if not 200 <= result[0] < 300:
+        raise _Uncached(result)
+    return result
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _raw_get_many(paths: tuple, api_base: str):
+    # the script thread only waits on I/O, so fan the GETs out; workers call
+    # the uncached _fetch with the session resolved here (Streamlit's caches
+    # want the script thread)
+    session = _session()
+    with ThreadPoolExecutor(max_workers=16) as ex:
+        results = dict(zip(paths, ex.map(lambda p: _fetch(p, api_base, session=session), paths)))
+    if any(not 200 <= status < 300 for status, _ in results.values()):
+        raise _Uncached(results)
+    return results
+
+
+def _clear_get_cache():
+    _raw_get.clear()
+    _raw_get_many.clear()
+
+
+def api_get(path: str, api_base: str, params: dict | None = None):
+    try:
+        return _raw_get(path, api_base, tuple(sorted((params or {}).items())))
+    except _Uncached as e:
+        return e.result
+
+
+def api_get_many(paths: list[str], api_base: str) -> dict:
+    """{path: (status, data)} for several GETs issued concurrently."""
+    try:
+        return _raw_get_many(tuple(paths), api_base)
+    except _Uncached as e:
+        return e.result
+
+
+def api_post(path: str, api_base: str, payload: dict, mutates: bool = True):
+    # mutates=False for read-only POSTs (/search): nothing cached goes stale
+    r = _session().post(f"{api_base}{path}", json=payload, timeout=60)
+    if mutates and r.ok:
+        _clear_get_cache()
     is_json = r.headers.get("content-type", "").startswith("application/json")
     return r.status_code, (r.json() if is_json else r.text)
 
 
 def api_delete(path: str, api_base: str, payload: dict):
     # FastAPI DELETE can accept JSON body if you coded it that way (you did).
-    r = requests.delete(f"{api_base}{path}", json=payload, timeout=30)
+    r = _session().delete(f"{api_base}{path}", json=payload, timeout=30)
+    if r.ok:
+        _clear_get_cache()
     is_json = r.headers.get("content-type", "").startswith("application/json")
     return r.status_code, (r.json() if is_json else r.text)
 
 
+WATCHES_PAGE_SIZE = 25
+# fixed table height: the grid scrolls (and only draws visible rows) instead of growing with the data
+TABLE_HEIGHT = 400
+
+
+def show_subscribers(wid):
+    st.session_state[f"open_{wid}"] = True
+
+
 def money(cents):
-    return "—" if cents is None else f"${cents/100:.2f}"
+    # integer-only: no float division, so no rounding artifacts
+    if cents is None:
+        return "—"
+    d, r = divmod(abs(int(cents)), 100)
+    return f"{'-' if cents < 0 else ''}${d:,}.{r:02d}"
 
 
 # -----------------------------
@@ -86,7 +170,7 @@ with tab_search:
             "max_results": int(max_results),
         }
 
-        status, data = api_post("/search", api_base, payload)
+        status, data = api_post("/search", api_base, payload, mutates=False)
 
         if status != 200:
             st.error(f"Search failed (status {status})")
@@ -107,7 +191,7 @@ with tab_search:
                     for o in offers
                 ]
                 st.success(f"Found {len(rows)} offers")
-                st.dataframe(rows, use_container_width=True)
+                st.dataframe(rows, height=TABLE_HEIGHT, use_container_width=True)
 
 
 # -----------------------------
@@ -161,18 +245,29 @@ with tab_my:
     st.subheader("My Watches (all watches in DB)")
 
     if st.button("Refresh watches"):
-        st.session_state["refresh_watches"] = True
+        _clear_get_cache()
 
-    status, data = api_get("/watches", api_base)
+    page = int(st.number_input("Page", min_value=1, value=1, step=1))
+    status, data = api_get("/watches", api_base, params={"page": page, "size": WATCHES_PAGE_SIZE})
     if status != 200:
         st.error(f"Failed to load watches (status {status})")
         st.write(data)
     else:
         watches = data.get("watches", [])
+        total = data.get("total", len(watches))
         if not watches:
-            st.info("No watches yet. Create one first.")
+            st.info("No watches yet. Create one first." if not total else "No watches on this page.")
         else:
-            st.caption("Tip: expand a watch to add/view subscribers.")
+            pages = -(-total // WATCHES_PAGE_SIZE)
+            st.caption(f"Page {page} of {pages} ({total} watches). Tip: expand a watch to add/view subscribers.")
+
+            subs_by_path = {}
+            if st.checkbox("Load subscribers for every watch on this page"):
+                subs_by_path = api_get_many(
+                    [f"/watches/{w.get('id') or w.get('watch_id')}/subscriptions" for w in watches],
+                    api_base,
+                )
+
             for w in watches:
                 wid = w.get("id") or w.get("watch_id")
                 title = f"#{wid} {w['origin']}→{w['destination']} {w['depart_date']} | {w.get('cabin','ECONOMY')} | {w.get('adults',1)} adult(s)"
@@ -212,8 +307,16 @@ with tab_my:
                     st.divider()
                     st.markdown("### Subscribers")
 
-                    if st.button("Load subscribers", key=f"btn_loadsubs_{wid}"):
-                        s3, d3 = api_get(f"/watches/{wid}/subscriptions", api_base)
+                    # fetched only once asked for; the flag keeps them shown across reruns
+                    st.button(
+                        "Load subscribers",
+                        key=f"btn_loadsubs_{wid}",
+                        on_click=show_subscribers,
+                        args=(wid,),
+                    )
+                    subs_path = f"/watches/{wid}/subscriptions"
+                    if subs_path in subs_by_path or st.session_state.get(f"open_{wid}"):
+                        s3, d3 = subs_by_path.get(subs_path) or api_get(subs_path, api_base)
                         if s3 == 200:
                             subs = d3.get("subscriptions", d3)
                             if not subs:
@@ -230,7 +333,7 @@ with tab_my:
                                             "Last emailed time": sub.get("last_emailed_seen_utc"),
                                         }
                                     )
-                                st.dataframe(rows, use_container_width=True)
+                                st.dataframe(rows, height=TABLE_HEIGHT, use_container_width=True)
                         else:
                             st.error(f"Failed to load subscribers (status {s3})")
                             st.write(d3)